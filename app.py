@@ -1,16 +1,29 @@
+import time
+PROCESS_STARTED = time.perf_counter()  # Taken before the heavy imports so the startup report includes them
+
 import os
 import json
-import requests
+import random
+import heapq
+import hashlib
+import re
+import contextlib
+import uuid
+import functools
+import aiohttp
 import discord
 from discord.ext import commands, tasks
 from discord import ui
+from aiohttp import web
 import asyncio
-import ping3
 import sys
+import sqlite3
+import threading
+from collections import deque
 import platform
-import psutil
+import pytz
 import logging
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timedelta
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,13 +31,110 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Load configuration from files
 CONFIG_FILE = 'config.json'
 KEYS_FILE = 'keys.json'
+FORECAST_FILE = 'forecast.json'
+JOBS_FILE = 'jobs.json'
+COMMAND_HASH_FILE = '.command_hash'  # Hash of the last synced slash commands, to skip needless syncs
 
 def load_json(file_path):
     """Loads JSON data from a file."""
     with open(file_path, 'r') as f:
         return json.load(f)
 
-config = load_json(CONFIG_FILE)
+class ConfigStore:
+    """Keeps the whole config document in memory, writes it back atomically and hot-reloads external edits."""
+
+    def __init__(self, path, save_delay=1.0):
+        self.path = path
+        self.save_delay = save_delay  # Seconds of quiet before batched updates are written
+        self.data = load_json(path)
+        self.mtime = os.stat(path).st_mtime_ns
+        self.listeners = []  # Called with {key: (old, new)} whenever the document changes
+        self._save_handle = None
+        self._pending = set()  # Keys updated in memory since the last write
+        self._write_lock = asyncio.Lock()
+
+    def subscribe(self, listener):
+        """Registers a change listener; usable as a decorator."""
+        self.listeners.append(listener)
+        return listener
+
+    def _notify(self, changes):
+        for listener in self.listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                logging.error(f"Error applying config change to {listener.__name__}: {e}")
+
+    def update(self, **values):
+        """Applies changed keys in memory, tells listeners, and schedules a batched write."""
+        changes = {key: (self.data.get(key), value) for key, value in values.items() if self.data.get(key) != value}
+        if not changes:
+            return
+        self.data.update(values)
+        self._pending.update(changes)
+        self._notify(changes)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # Not running yet (or any more); write straight away
+            self._write(json.dumps(self.data, indent=4))
+            self._pending.clear()
+            return
+        if self._save_handle is None:
+            self._save_handle = loop.call_later(self.save_delay, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        """Writes the document now if a batched write is pending."""
+        if self._save_handle is None:
+            return
+        self._save_handle.cancel()
+        self._save_handle = None
+        self._pending.clear()
+        document = json.dumps(self.data, indent=4)  # Serialised here so the thread never sees a half-applied update
+        async with self._write_lock:
+            await asyncio.to_thread(self._write, document)
+
+    def _write(self, document):
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(document)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self.mtime = os.stat(self.path).st_mtime_ns  # Our own write must not look like an external edit
+
+    def check(self, force=False):
+        """Re-reads the file if it changed on disk (or if forced) and pushes the differences to listeners.
+
+        Keys updated in memory but not yet written keep their new values; the pending write then saves both.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if (mtime == self.mtime and not force) or self._write_lock.locked():
+            return {}
+        try:
+            data = load_json(self.path)
+        except ValueError as e:  # Usually caught mid-save by an editor; the next check will see the finished file
+            logging.warning(f"Ignoring unreadable {self.path}: {e}")
+            return {}
+        self.mtime = mtime
+        # Updates still waiting for their batched write win over the file for the keys they touch
+        data.update({key: self.data[key] for key in self._pending if key in self.data})
+        changes = {
+            key: (self.data.get(key), data.get(key))
+            for key in self.data.keys() | data.keys()
+            if self.data.get(key) != data.get(key)
+        }
+        if changes:
+            self.data.clear()
+            self.data.update(data)
+            logging.info(f"Reloaded {self.path}: {', '.join(sorted(changes))} changed")
+            self._notify(changes)
+        return changes
+
+config_store = ConfigStore(CONFIG_FILE)
+config = config_store.data
 keys = load_json(KEYS_FILE)
 
 # Constants - use uppercase for these
@@ -34,14 +144,60 @@ FX_PANEL_LINK = config.get('fx_panel_link', '')
 SERVER_IP = config.get('server_ip', '')
 LOG_CHANNEL_ID = config.get('log_channel_id', int)  # Ensure this is an integer
 CHECK_INTERVAL = config.get('check_interval', int)  # Ensure this is an integer
+LOG_BATCH_WINDOW = config.get('log_batch_window', 2)  # Seconds log events are held to be sent together
+LOG_QUEUE_LIMIT = config.get('log_queue_limit', 50)  # Log embeds queued before floods are dropped and summarised
+LOG_MIN_INTERVAL = config.get('log_min_interval', 1)  # Minimum seconds between log-channel messages
+CONFIG_WATCH_INTERVAL = config.get('config_watch_interval', 5)  # Seconds between checks for external edits to the config file
+config_store.save_delay = config.get('config_save_delay', 1.0)
+DO_API_URL = config.get('do_api_url', 'https://api.digitalocean.com/v2')
+DO_TIMEOUT = config.get('do_timeout', 10)  # Seconds per request attempt
+DO_MAX_RETRIES = config.get('do_max_retries', 3)
+HTTP_POOL_SIZE = config.get('http_pool_size', 20)
+FX_PAGE_SIZE = config.get('fx_page_size', 20)
+PLAYER_POLL_INTERVAL = config.get('player_poll_interval', 30)  # Seconds between background polls
+PLAYER_SNAPSHOT_TTL = config.get('player_snapshot_ttl', 60)  # Seconds before the snapshot is considered stale
+DROPLET_CACHE_TTL = config.get('droplet_cache_ttl', 300)  # Seconds before droplet details are re-fetched
+ACTION_TIMEOUT = config.get('action_timeout', 1800)  # Seconds to wait for a DigitalOcean action to finish
+TELEMETRY_HOST = config.get('telemetry_host', '127.0.0.1')
+TELEMETRY_PORT = config.get('telemetry_port', 9108)  # Local port serving /metrics; null disables the endpoint
+DASHBOARD_INTERVAL = max(5, config.get('dashboard_interval', 15))  # Seconds between dashboard checks; at most one edit each
+LOOP_LAG_INTERVAL = config.get('loop_lag_interval', 0.5)  # Seconds between event-loop lag samples
+ACTION_DEDUPE_WINDOW = config.get('action_dedupe_window', 60)  # Seconds an identical droplet action is merged into the first
+MAX_CONCURRENT_DROPLETS = config.get('max_concurrent_droplets', 4)  # Droplets evaluated or acted on at once
+MAX_CONCURRENT_PER_TENANT = config.get('max_concurrent_per_tenant', max(1, MAX_CONCURRENT_DROPLETS // 2))  # So one community cannot hog the monitor
+TIMEZONE = config.get('timezone', 'Australia/Sydney')
+AUTOSCALE_WINDOW = config.get('autoscale_window', 900)  # Seconds of load history the autoscaler looks at
+RESIZE_COOLDOWN = config.get('resize_cooldown', 1800)  # Seconds after a resize before scaling down again
+SCALE_UP_COOLDOWN = config.get('scale_up_cooldown', 600)  # Seconds after a resize before scaling up again
+SCALE_DOWN_HYSTERESIS = config.get('scale_down_hysteresis', 0.2)  # Fraction of headroom required before scaling down
+CPU_SCALE_UP = config.get('cpu_scale_up', 85)  # Host CPU % that forces the next plan up
+RAM_SCALE_UP = config.get('ram_scale_up', 90)  # Host RAM % that forces the next plan up
+CPU_SCALE_DOWN = config.get('cpu_scale_down', 40)  # Host CPU % above which we never scale down
+MIN_PLAN = config.get('min_plan', 'low')  # TEMP 'low' until the 'off' plan resize error (smaller disk) is fixed
+FORECAST_SLOT_MINUTES = config.get('forecast_slot_minutes', 15)
+FORECAST_ALPHA = config.get('forecast_alpha', 0.3)  # Weight of the newest week in each slot's average
+RESIZE_LEAD_TIME = config.get('resize_lead_time', 900)  # Initial guess at seconds from deciding to resize until the droplet is back
+GAME_PORT = config.get('game_port')  # TCP port probed for reachability; skipped when unset
+PROBE_INTERVAL = config.get('probe_interval', 30)  # Seconds between health-probe rounds
+PROBE_TIMEOUT = config.get('probe_timeout', 2)  # Seconds before a single probe counts as lost
+PROBE_JITTER = config.get('probe_jitter', 5)  # Max random delay before each droplet's probes
+PROBE_WINDOW = config.get('probe_window', 120)  # Results kept per target for percentiles and loss
+UNRESPONSIVE_THRESHOLD = config.get('unresponsive_threshold', 3)  # Consecutive failed rounds before alerting
+METRICS_DB = config.get('metrics_db', 'metrics.db')
+METRICS_FLUSH_INTERVAL = config.get('metrics_flush_interval', 30)  # Seconds between batched writes
+METRICS_RETENTION = {'raw': 2, '5m': 35, '1h': 400, **config.get('metrics_retention', {})}  # Days kept per resolution
+COORDINATION = config.get('coordination') or {}  # Backend for leader election and shared state when running several replicas
+LEASE_SECONDS = COORDINATION.get('lease_seconds', max(3, CHECK_INTERVAL * 3 / 4))  # A lease plus one renewal fits in a check interval
+SHARD_COUNT = config.get('shard_count')  # Shards across every replica; unset runs one unsharded connection
+SHARD_IDS = config.get('shard_ids')  # Shards this replica connects; all of them when unset
 
 # API Keys
 DISCORD_BOT_TOKEN = keys.get('discord_bot_token', '')
 CONFIRM_COMMAND = keys.get('confirm_command', '')
 DIGITAL_OCEAN_KEY = keys.get('digital_ocean_key', '')
 
-# Droplet Plans
-PLANS = {
+# Droplet Plans; the 'plans' section of the config overrides these
+DEFAULT_PLANS = {
     'not_set': None,
     'off': 's-1vcpu-2gb-intel',  # 0.024/hr
     'low': 's-2vcpu-4gb-amd',   # 0.042/hr
@@ -49,124 +205,1774 @@ PLANS = {
     'high': 's-4vcpu-16gb-amd',  # $0.125/hr
     'ultra': 's-v8cpu-16gb-amd'  # 0.167/hr
 }
+PLANS = {**DEFAULT_PLANS, **config.get('plans', {})}
+
+# Hourly USD price of each size slug
+DEFAULT_PRICES = {
+    's-1vcpu-2gb-intel': 0.024,
+    's-2vcpu-4gb-amd': 0.042,
+    's-4vcpu-8gb-amd': 0.083,
+    's-4vcpu-16gb-amd': 0.125,
+    's-v8cpu-16gb-amd': 0.167,
+}
+PLAN_PRICES = {**DEFAULT_PRICES, **config.get('prices', {})}
+BASELINE_PLAN = config.get('baseline_plan', 'high')  # Plan the cost report compares actual spend against
+
+# Plans from smallest to largest, and how many players each comfortably holds
+PLAN_ORDER = ['off', 'low', 'medium', 'high', 'ultra']
+DEFAULT_CAPACITY = {'off': 0, 'low': 8, 'medium': 24, 'high': 48, 'ultra': 64}
+
+# Default daily schedule (local time); each entry applies until the next one starts
+DEFAULT_SCHEDULE = [
+    {'from': '02:00', 'plan': 'low'},  # TEMP low until the 'off' plan resize error (smaller disk) is fixed
+    {'from': '07:30', 'plan': 'low'},
+    {'from': '13:30', 'plan': 'medium'},
+    {'from': '16:00', 'plan': 'high'},
+    {'from': '20:00', 'plan': 'medium'},
+]
 
 # Global Variables - use lowercase with underscores
-temporary_schedule = {}
-servers_not_resizing_count = 0
-last_resize_time = None
-reboot_scheduled = False
-disable_resizing = False
+reboot_scheduled = False  # True while a reboot job is pending
 
 # Discord Bot Setup
 if sys.version_info[0] == 3 and sys.version_info[1] >= 8 and platform.system() == 'Windows':
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
+# --- Startup ---
+startup_timings = []  # (phase, seconds) in the order the phases ran
+ready_after = None  # Seconds from process start until on_ready, when interactions are first handled
+bootstrapped = False
+
+@contextlib.contextmanager
+def startup_phase(name):
+    """Times a startup phase for the startup report."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings.append((name, time.perf_counter() - started))
+
+def startup_report():
+    """One-line summary of how long each startup phase took."""
+    phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in startup_timings)
+    return f"{phases}; first interaction possible after {ready_after:.2f}s, caches warm after {time.perf_counter() - PROCESS_STARTED:.2f}s"
+
+class FXBot(commands.AutoShardedBot if SHARD_COUNT else commands.Bot):
+    """Bot subclass that loads local state before connecting and releases shared resources on shutdown."""
+
+    async def setup_hook(self):
+        # Local files only; nothing here waits on DigitalOcean or the FX API
+        with startup_phase("local state"):
+            forecaster.load()
+            await cost_engine.load()
+            await seed_forecaster()
+            await scheduler.load()
+        # One persistent view handles the buttons on every management message, including ones sent before a restart;
+        # callbacks look the tenant up from the interaction, so the per-tenant views are only used for rendering
+        for tenant in tenants.values():
+            tenant.view = DropletManagementView(tenant)
+        self.add_view(DropletManagementView())
+        self.connect_started = time.perf_counter()
+
+    async def close(self):
+        await telemetry.stop()
+        with contextlib.suppress(Exception):
+            await asyncio.wait_for(asyncio.gather(*(tenant.log.flush() for tenant in tenants.values())), timeout=5)
+        await config_store.flush()
+        await leader_election.resign()  # Lets another replica take over straight away
+        await coordinator.close()
+        await close_http_session()
+        await metrics_store.close()
+        await super().close()
+
+class FXCommandTree(discord.app_commands.CommandTree):
+    """Command tree that only answers guilds served by a tenant, and only on the replica meant to answer."""
+
+    async def interaction_check(self, interaction):
+        if not handles_events():
+            return False  # Another replica answers this one
+        if tenant_for(interaction) is None:
+            await interaction.response.send_message("This server is not managed by this bot.", ephemeral=True)
+            return False
+        return True
+
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix='!', intents=intents)
-
-# Load Permissions from config
-def load_permissions():
-    """Loads permissions from the configuration file."""
-    if os.path.exists(CONFIG_FILE):
-        return load_json(CONFIG_FILE)
-    return {'droplet_perms': [], 'authorized_users': [], 'restart_perms': []}
-
-permissions = load_permissions()
-droplet_perms = permissions.get('droplet_perms', [])
-authorized_users = permissions.get('authorized_users', [])
-restart_perms = permissions.get('restart_perms', [])
-
-def save_permissions():
-    """Saves permissions to the configuration file."""
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump({
-            'droplet_perms': droplet_perms,
-            'authorized_users': authorized_users,
-            'restart_perms': restart_perms
-        }, f)
+shard_options = {'shard_count': SHARD_COUNT, 'shard_ids': SHARD_IDS} if SHARD_COUNT else {}
+bot = FXBot(command_prefix='!', intents=intents, tree_cls=FXCommandTree, **shard_options)
+
+@bot.check
+async def served_guild(ctx):
+    """Ignores prefix commands from guilds no tenant serves."""
+    return tenant_for(ctx) is not None
+
+# --- Telemetry ---
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)  # Seconds
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (the observed max for the +Inf bucket)."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+class Telemetry:
+    """In-process counters and histograms, rendered in the Prometheus text format."""
 
-# --- DigitalOcean API Interactions ---
-def get_size_slug():
-    """Retrieves the current size slug of the droplet from the DigitalOcean API."""
-    url = f'https://api.digitalocean.com/v2/droplets/{DROPLET_ID}'
-    headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {DIGITAL_OCEAN_KEY}'}
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        data = response.json()
-        return data['droplet']['size']['slug']
-    else:
-        logging.error(f"Failed to retrieve size name: {response.content.decode()}")
-        return "Unknown"
+    def __init__(self):
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.help = {}
+        self.runner = None
+        self.lag_task = None
+
+    def inc(self, metric, amount=1, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, metric, value, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        self.histograms[key].observe(value)
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def series(self, name):
+        """{labels: value or Histogram} for one metric."""
+        items = list(self.counters.items()) + list(self.histograms.items())
+        return {dict_labels: value for (metric, dict_labels), value in items if metric == name}
+
+    def cache_ratio(self, cache):
+        """Fraction of lookups in a cache that were hits, or None before the first lookup."""
+        hits = misses = 0
+        for labels, value in self.series('fxbot_cache_requests_total').items():
+            labels = dict(labels)
+            if labels['cache'] == cache:
+                hits += value if labels['result'] == 'hit' else 0
+                misses += value if labels['result'] != 'hit' else 0
+        return hits / (hits + misses) if hits + misses else None
+
+    @staticmethod
+    def _labels(labels, **extra):
+        pairs = list(labels) + list(extra.items())
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for key, value in pairs) + '}'
+
+    def render(self):
+        lines = []
+        for name in sorted({metric for metric, _ in self.counters} | {metric for metric, _ in self.histograms}):
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            series = self.series(name)
+            if any(isinstance(value, Histogram) for value in series.values()):
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._labels(labels, le=bound)} {cumulative}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{self._labels(labels)} {histogram.count}")
+            else:
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{self._labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def _watch_loop_lag(self, interval):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.observe('fxbot_event_loop_lag_seconds', max(0.0, time.perf_counter() - started - interval))
+
+    async def _serve_metrics(self, request):
+        return web.Response(text=self.render(), content_type='text/plain', charset='utf-8', headers={'X-Content-Type-Options': 'nosniff'})
+
+    async def start(self, host=TELEMETRY_HOST, port=TELEMETRY_PORT, lag_interval=LOOP_LAG_INTERVAL):
+        """Starts the loop-lag sampler and, if a port is configured, the /metrics endpoint."""
+        if self.lag_task is None:
+            self.lag_task = asyncio.create_task(self._watch_loop_lag(lag_interval))
+        if port is None or self.runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self._serve_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        try:
+            await web.TCPSite(self.runner, host, port).start()
+            logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+        except OSError as e:
+            logging.error(f"Could not serve metrics on {host}:{port}: {e}")
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def stop(self):
+        if self.lag_task is not None:
+            self.lag_task.cancel()
+            self.lag_task = None
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+telemetry = Telemetry()
+telemetry.describe('fxbot_event_loop_lag_seconds', "How late a short sleep on the event loop woke up.")
+telemetry.describe('fxbot_interaction_seconds', "Time from an interaction being created until its handler finished.")
+telemetry.describe('fxbot_http_requests_total', "Outbound HTTP requests by host, endpoint and status.")
+telemetry.describe('fxbot_http_request_seconds', "Outbound HTTP request duration by host and endpoint.")
+telemetry.describe('fxbot_monitor_tick_seconds', "Duration of one monitor_server pass over the fleet.")
+telemetry.describe('fxbot_cache_requests_total', "Cache lookups by cache and result.")
+telemetry.describe('fxbot_leadership_changes_total', "Times this replica became the leader or a follower.")
+
+def endpoint_of(path):
+    """Collapses IDs in a URL path so requests to the same route share a label."""
+    return re.sub(r'/\d+(?=/|$)', '/{id}', path)
+
+def interaction_elapsed(interaction):
+    """Seconds since Discord created the interaction, i.e. since the user clicked or ran the command."""
+    return max(0.0, (discord.utils.utcnow() - interaction.created_at).total_seconds())
+
+def instrument_view(view):
+    """Wraps every component callback in a view to record how long it takes."""
+    for item in view.children:
+        func = getattr(item.callback, 'callback', item.callback)  # Decorated items wrap the method in a bound helper
+        item.callback = _timed_component(item.callback, f"{type(view).__name__}.{getattr(func, '__name__', type(item).__name__)}")
+    return view
+
+def _timed_component(callback, name):
+    async def wrapper(interaction):
+        outcome = 'ok'
+        try:
+            return await callback(interaction)
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            telemetry.observe('fxbot_interaction_seconds', interaction_elapsed(interaction), kind='component', name=name, outcome=outcome)
+    return wrapper
+
+# --- Permission Engine ---
+# Capability -> config lists of user IDs and role IDs that grant it
+CAPABILITIES = {
+    'manage': {'users': ('authorized_users',), 'roles': ('droplet_perms',)},
+    'panel': {'users': ('authorized_users',), 'roles': ('droplet_perms',), 'open_if_empty': True},
+    'restart': {'users': ('authorized_users',), 'roles': ('droplet_perms', 'restart_perms')},
+}
+class PermissionEngine:
+    """Resolves capabilities against precomputed ID sets.
+
+    A check is two set lookups against the roles that come with every interaction, so decisions are not cached.
+    """
+
+    def __init__(self, capabilities=CAPABILITIES):
+        self.capabilities = capabilities
+        self.users = {}  # Capability -> frozenset of user IDs
+        self.roles = {}  # Capability -> frozenset of role IDs
+        self.open = set()  # Capabilities nobody is configured for that are open to everyone
+
+    def rebuild(self, settings):
+        """Recomputes the ID sets from a tenant's permission lists."""
+        for name, spec in self.capabilities.items():
+            self.users[name] = frozenset(int(i) for key in spec['users'] for i in settings.get(key, []))
+            self.roles[name] = frozenset(int(i) for key in spec['roles'] for i in settings.get(key, []))
+            if spec.get('open_if_empty') and not self.users[name] and not self.roles[name]:
+                self.open.add(name)
+            else:
+                self.open.discard(name)
+
+    def allowed(self, member, capability):
+        """True if the member holds the capability through their user ID or any of their roles."""
+        return (
+            capability in self.open
+            or member.id in self.users[capability]
+            or not self.roles[capability].isdisjoint(role.id for role in getattr(member, 'roles', ()))
+        )
 
-current_plan = get_size_slug()
+def requires(capability, denied_message="You don't have permission to use this command."):
+    """Decorator that only runs a command, button or select callback if the invoking member holds a capability."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            context = next(arg for arg in args if isinstance(arg, (discord.Interaction, commands.Context)))
+            permissions = tenant_for(context).permissions
+            if isinstance(context, discord.Interaction):
+                if not permissions.allowed(context.user, capability):
+                    await context.response.send_message(denied_message, ephemeral=True)
+                    return
+            elif not permissions.allowed(context.author, capability):
+                await context.send(denied_message)
+                return
+            return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# --- Shared HTTP Session ---
+http_session = None
+
+async def get_http_session():
+    """Returns the shared keep-alive aiohttp session, creating it on first use."""
+    global http_session
+    if http_session is None or http_session.closed:
+        connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, keepalive_timeout=60, ttl_dns_cache=300)
+        http_session = aiohttp.ClientSession(connector=connector, trace_configs=[http_trace_config()])
+    return http_session
+
+def http_trace_config():
+    """Counts and times every request made through the shared session."""
+    async def on_request_start(session, context, params):
+        context.started = time.perf_counter()
+
+    def record(context, params, status):
+        labels = {'host': params.url.host, 'endpoint': endpoint_of(params.url.path)}
+        telemetry.inc('fxbot_http_requests_total', **labels, status=status)
+        telemetry.observe('fxbot_http_request_seconds', time.perf_counter() - context.started, **labels)
+
+    async def on_request_end(session, context, params):
+        record(context, params, str(params.response.status))
+
+    async def on_request_exception(session, context, params):
+        record(context, params, type(params.exception).__name__)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+async def close_http_session():
+    """Closes the shared aiohttp session."""
+    global http_session
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+    http_session = None
+
+# --- Metrics Store ---
+class MetricsStore:
+    """SQLite (WAL) time-series store with batched writes off the event loop and rollup retention tiers.
+
+    Raw samples are rolled up into 5-minute and hourly buckets; each resolution is
+    pruned after its retention period so the file stays small.
+    """
+
+    RESOLUTIONS = (('5m', 300), ('1h', 3600))
+
+    def __init__(self, path=METRICS_DB, retention=METRICS_RETENTION):
+        self.path = path
+        self.retention = retention
+        self._pending_samples = []
+        self._pending_events = []
+        self._conn = None
+        self._db_lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS samples (metric TEXT, series TEXT, ts INTEGER, value REAL);
+                CREATE INDEX IF NOT EXISTS samples_lookup ON samples (metric, series, ts);
+                CREATE TABLE IF NOT EXISTS rollups (
+                    resolution INTEGER, metric TEXT, series TEXT, ts INTEGER,
+                    avg REAL, min REAL, max REAL, count INTEGER,
+                    PRIMARY KEY (resolution, metric, series, ts)
+                );
+                CREATE TABLE IF NOT EXISTS events (ts INTEGER, kind TEXT, series TEXT, detail TEXT);
+                CREATE INDEX IF NOT EXISTS events_lookup ON events (kind, ts);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+            """)
+        return self._conn
+
+    def record(self, metric, series, value, timestamp=None):
+        """Queues a sample; it is written on the next flush."""
+        self._pending_samples.append((metric, str(series), int(timestamp or time.time()), value))
+
+    def record_event(self, kind, series, timestamp=None, **detail):
+        """Queues an event such as a resize outcome; it is written on the next flush."""
+        self._pending_events.append((int(timestamp or time.time()), kind, str(series), json.dumps(detail)))
+
+    async def flush(self):
+        """Writes queued samples and events in one transaction on a worker thread."""
+        if not self._pending_samples and not self._pending_events:
+            return
+        samples, self._pending_samples = self._pending_samples, []
+        events, self._pending_events = self._pending_events, []
+        try:
+            await asyncio.to_thread(self._write, samples, events)
+        except sqlite3.Error as e:
+            # e.g. "database is locked" while another replica writes; keep the batch for the next flush
+            logging.error(f"Failed to write metrics, will retry: {e!r}")
+            self._pending_samples[:0] = samples
+            self._pending_events[:0] = events
+
+    def _write(self, samples, events):
+        with self._db_lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany('INSERT INTO samples VALUES (?, ?, ?, ?)', samples)
+                conn.executemany('INSERT INTO events VALUES (?, ?, ?, ?)', events)
+
+    async def compact(self):
+        """Rolls recent data up into coarser buckets and prunes expired rows."""
+        await asyncio.to_thread(self._compact, int(time.time()))
+
+    def _compact(self, now):
+        with self._db_lock:
+            conn = self._connect()
+            with conn:
+                # Rebuild every bucket raw data may have changed since the last compaction, then the hours above them
+                row = conn.execute("SELECT value FROM meta WHERE key = 'rolled_up_to'").fetchone()
+                since = row[0] if row else 0
+                conn.execute("""
+                    INSERT OR REPLACE INTO rollups
+                    SELECT 300, metric, series, ts / 300 * 300 AS bucket, AVG(value), MIN(value), MAX(value), COUNT(*)
+                    FROM samples WHERE ts >= ? GROUP BY metric, series, bucket
+                """, (since // 300 * 300,))
+                conn.execute("""
+                    INSERT OR REPLACE INTO rollups
+                    SELECT 3600, metric, series, ts / 3600 * 3600 AS bucket,
+                           SUM(avg * count) / SUM(count), MIN(min), MAX(max), SUM(count)
+                    FROM rollups WHERE resolution = 300 AND ts >= ? GROUP BY metric, series, bucket
+                """, (since // 3600 * 3600,))
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('rolled_up_to', ?)", (now,))
+                conn.execute('DELETE FROM samples WHERE ts < ?', (now - self.retention['raw'] * 86400,))
+                conn.execute('DELETE FROM events WHERE ts < ?', (now - self.retention['1h'] * 86400,))
+                for name, seconds in self.RESOLUTIONS:
+                    conn.execute('DELETE FROM rollups WHERE resolution = ? AND ts < ?', (seconds, now - self.retention[name] * 86400))
+
+    async def query(self, metric, series, start, end=None):
+        """Returns [(ts, avg, min, max, count)] between two UNIX times at the finest resolution still kept for start."""
+        end = end or time.time()
+        return await asyncio.to_thread(self._query, metric, str(series), int(start), int(end))
+
+    def _query(self, metric, series, start, end):
+        age_days = (time.time() - start) / 86400
+        with self._db_lock:
+            conn = self._connect()
+            if age_days <= self.retention['raw']:
+                rows = conn.execute(
+                    'SELECT ts, value, value, value, 1 FROM samples WHERE metric = ? AND series = ? AND ts BETWEEN ? AND ? ORDER BY ts',
+                    (metric, series, start, end)).fetchall()
+                return rows
+            resolution = 300 if age_days <= self.retention['5m'] else 3600
+            return conn.execute(
+                'SELECT ts, avg, min, max, count FROM rollups WHERE resolution = ? AND metric = ? AND series = ? AND ts BETWEEN ? AND ? ORDER BY ts',
+                (resolution, metric, series, start, end)).fetchall()
+
+    async def events(self, kind, start, end=None):
+        """Returns [(ts, series, detail dict)] for events of one kind between two UNIX times."""
+        end = end or time.time()
+        rows = await asyncio.to_thread(self._events, kind, int(start), int(end))
+        return [(ts, series, json.loads(detail)) for ts, series, detail in rows]
+
+    def _events(self, kind, start, end):
+        with self._db_lock:
+            return self._connect().execute(
+                'SELECT ts, series, detail FROM events WHERE kind = ? AND ts BETWEEN ? AND ? ORDER BY ts',
+                (kind, start, end)).fetchall()
+
+    async def close(self):
+        """Flushes anything pending and closes the database."""
+        await self.flush()
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+metrics_store = MetricsStore()
+
+@tasks.loop(seconds=METRICS_FLUSH_INTERVAL)
+async def flush_metrics():
+    """Writes batched metrics and compacts the store every few minutes."""
+    await metrics_store.flush()
+    if flush_metrics.current_loop % max(1, 300 // METRICS_FLUSH_INTERVAL) == 0:
+        try:
+            await metrics_store.compact()
+        except sqlite3.Error as e:
+            logging.error(f"Failed to compact metrics: {e!r}")  # Not retried by the loop, so it would stop for good
+
+# --- DigitalOcean API Client ---
+class DigitalOceanError(Exception):
+    """Raised when the DigitalOcean API cannot be reached after all retries."""
+
+class DigitalOceanClient:
+    """Async DigitalOcean API client with per-request timeouts and retries."""
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, token, base_url=DO_API_URL, timeout=DO_TIMEOUT, max_retries=DO_MAX_RETRIES, backoff=1.0):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    @property
+    def headers(self):
+        """Headers attached to every request."""
+        return {'Content-Type': 'application/json', 'Authorization': f'Bearer {self.token}'}
+
+    def _retry_delay(self, attempt, response=None):
+        """Works out how long to wait before the next attempt, honouring Retry-After and DO rate-limit headers."""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after is not None:
+                try:
+                    return max(float(retry_after), 0.0)
+                except ValueError:
+                    pass
+            reset = response.headers.get('RateLimit-Reset')
+            if response.status == 429 and reset is not None:
+                try:
+                    return max(float(reset) - time.time(), 0.0)
+                except ValueError:
+                    pass
+        return self.backoff * (2 ** attempt) + random.uniform(0, self.backoff)
+
+    async def _send(self, method, path, extra_headers=None, **kwargs):
+        """Sends a request and returns (status, data, response headers).
+
+        Failures to connect and 429 responses are retried for every method. Timeouts, dropped
+        connections and 5xx responses are only retried for GET, since DigitalOcean may already
+        have accepted the request, so actions are never submitted twice.
+        """
+        session = await get_http_session()
+        url = f'{self.base_url}{path}'
+        headers = self.headers if not extra_headers else {**self.headers, **extra_headers}
+        retry_statuses = self.RETRY_STATUSES if method == 'GET' else {429}
+        retry_errors = (aiohttp.ClientError, asyncio.TimeoutError) if method == 'GET' else (aiohttp.ClientConnectorError,)
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with session.request(method, url, headers=headers, timeout=self.timeout, **kwargs) as response:
+                    text = await response.text()
+                    if response.status in retry_statuses and attempt < self.max_retries:
+                        delay = self._retry_delay(attempt, response)
+                        logging.warning(f"DigitalOcean {method} {path} returned {response.status}; retrying in {delay:.1f}s")
+                        await asyncio.sleep(delay)
+                        continue
+                    try:
+                        data = json.loads(text) if text else {}
+                    except ValueError:
+                        data = {'message': text}
+                    return response.status, data, response.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = e
+                if not isinstance(e, retry_errors):
+                    break  # The request may have reached DigitalOcean; resending could start a second action
+                if attempt < self.max_retries:
+                    delay = self._retry_delay(attempt)
+                    logging.warning(f"DigitalOcean {method} {path} failed ({e!r}); retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+        raise DigitalOceanError(f"{method} {path} failed after {attempt + 1} attempts: {last_error!r}")
+
+    async def request(self, method, path, **kwargs):
+        """Sends a request and returns (status, data)."""
+        status, data, _ = await self._send(method, path, **kwargs)
+        return status, data
+
+    async def get(self, path, **kwargs):
+        return await self.request('GET', path, **kwargs)
+
+    async def get_conditional(self, path, etag=None):
+        """GETs a resource with If-None-Match and returns (status, data, etag); status is 304 if unchanged."""
+        extra_headers = {'If-None-Match': etag} if etag else None
+        status, data, headers = await self._send('GET', path, extra_headers=extra_headers)
+        return status, data, headers.get('ETag', etag)
+
+    async def post(self, path, payload, **kwargs):
+        return await self.request('POST', path, json=payload, **kwargs)
+
+do_client = DigitalOceanClient(DIGITAL_OCEAN_KEY)
+
+# --- Droplet State Cache ---
+class DropletStateCache:
+    """Caches the droplet's size and status so the embed, monitor and dialogs share one API call."""
+
+    def __init__(self, droplet_id, client=do_client, ttl=DROPLET_CACHE_TTL):
+        self.droplet_id = droplet_id
+        self.client = client
+        self.ttl = ttl
+        self.size_slug = "Unknown"
+        self.status = None
+        self.vcpus = None
+        self.memory = None  # MB
+        self.disk = None  # GB
+        self.locked = False
+        self.size_listeners = []  # Called with the new slug whenever the size changes
+        self.in_flight_action = None  # (action_type, size) issued by us and not yet completed
+        self.etag = None
+        self.fetched_at = None
+        self.invalidated_at = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def is_fresh(self):
+        return self.fetched_at is not None and time.monotonic() - self.fetched_at < self.ttl
+
+    def invalidate(self, in_flight_action=None):
+        """Marks the cache stale, optionally recording an action we have just issued."""
+        self.fetched_at = None
+        self.invalidated_at = time.monotonic()
+        if in_flight_action is not None:
+            self.in_flight_action = in_flight_action
+
+    def _apply(self, droplet):
+        previous = self.size_slug
+        self.size_slug = droplet['size']['slug']
+        if self.size_slug != previous:
+            for listener in self.size_listeners:
+                listener(self.size_slug)
+        self.status = droplet.get('status')
+        self.vcpus = droplet.get('vcpus')
+        self.memory = droplet.get('memory')
+        self.disk = droplet.get('disk')
+        self.locked = droplet.get('locked', False)
+
+    async def refresh(self, force=False):
+        """Refreshes from the API using a conditional GET. Concurrent callers share one request."""
+        async with self._lock:
+            if not force and self.is_fresh:
+                return
+            try:
+                status, data, etag = await self.client.get_conditional(f'/droplets/{self.droplet_id}', self.etag)
+            except DigitalOceanError as e:
+                logging.error(f"Failed to retrieve droplet state: {e}")
+                return
+            telemetry.inc('fxbot_cache_requests_total', cache='droplet_etag', result='hit' if status == 304 else 'miss')
+            if status == 200:
+                self._apply(data['droplet'])
+                self.etag = etag
+            elif status != 304:
+                logging.error(f"Failed to retrieve droplet state: {data}")
+                return
+            self.fetched_at = time.monotonic()
+
+    async def get(self):
+        """Returns the cache, refreshing first only if it is stale."""
+        fresh = self.is_fresh
+        telemetry.inc('fxbot_cache_requests_total', cache='droplet_state', result='hit' if fresh else 'miss')
+        if not fresh:
+            await self.refresh()
+        return self
+
+    def snapshot(self):
+        """The cached fields with a wall-clock fetch time, for other replicas to absorb."""
+        return {
+            'droplet': {
+                'size': {'slug': self.size_slug}, 'status': self.status, 'vcpus': self.vcpus,
+                'memory': self.memory, 'disk': self.disk, 'locked': self.locked,
+            },
+            'etag': self.etag,
+            'fetched_at': time.time() - (time.monotonic() - self.fetched_at),
+        }
+
+    def absorb(self, snapshot):
+        """Adopts another replica's snapshot if it is newer than this cache and anything we invalidated it for."""
+        fetched_at = time.monotonic() - (time.time() - snapshot['fetched_at'])
+        if fetched_at <= max(self.fetched_at or float('-inf'), self.invalidated_at or float('-inf')):
+            return
+        self._apply(snapshot['droplet'])
+        self.etag = snapshot['etag']
+        self.fetched_at = fetched_at
+
+    def describe(self):
+        """Short human-readable summary of the droplet hardware and status."""
+        if self.vcpus is None:
+            return "Unknown"
+        return f"{self.status} • {self.vcpus} vCPU • {self.memory / 1024:g} GB RAM • {self.disk} GB disk"
+
+# --- Action Tracker ---
+class ActionTracker:
+    """Polls /v2/actions/{id} with adaptive backoff until each tracked action completes or errors."""
+
+    def __init__(self, client=do_client, min_interval=2.0, max_interval=30.0, timeout=ACTION_TIMEOUT):
+        self.client = client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.timeout = timeout
+        self.actions = {}  # action_id -> {'id', 'type', 'status', 'started_at', 'future'} while in progress
+        self.latest = {}  # Droplet ID -> entry of its most recent action, kept after it finishes
+        self._tasks = {}
+
+    def track(self, action_id, action_type, state=None):
+        """Starts polling an action and returns a future resolving to its final status.
+
+        The final status is 'completed', 'errored' or 'timeout'. If a DropletStateCache
+        is given, its in-flight action is cleared and it is invalidated once the action ends.
+        """
+        if action_id in self.actions:
+            return self.actions[action_id]['future']
+        future = asyncio.get_running_loop().create_future()
+        self.actions[action_id] = {'id': action_id, 'type': action_type, 'status': 'in-progress', 'started_at': time.monotonic(), 'future': future}
+        if state is not None:
+            self.latest[state.droplet_id] = self.actions[action_id]
+        self._tasks[action_id] = asyncio.create_task(self._poll(action_id, state))
+        return future
+
+    def entry(self, action_id):
+        """The tracked action, or None once it has finished and a newer action replaced it."""
+        entry = self.actions.get(action_id)
+        if entry is None:
+            entry = next((entry for entry in self.latest.values() if entry['id'] == action_id), None)
+        return entry
+
+    async def wait(self, action_id):
+        """Waits for a tracked action to finish and returns its final status."""
+        return await asyncio.shield(self.entry(action_id)['future'])
+
+    async def _poll(self, action_id, state):
+        client = state.client if state is not None else self.client  # The tenant's account that owns the droplet
+        entry = self.actions[action_id]
+        interval = self.min_interval
+        deadline = entry['started_at'] + self.timeout
+        status = 'timeout'
+        try:
+            while time.monotonic() < deadline:
+                await asyncio.sleep(interval)
+                try:
+                    code, data = await client.get(f'/actions/{action_id}')
+                except DigitalOceanError as e:
+                    logging.warning(f"Failed to poll action {action_id}: {e}")
+                    code, data = None, {}
+                if code == 200 and data['action']['status'] in ('completed', 'errored'):
+                    status = data['action']['status']
+                    break
+                interval = min(interval * 1.5, self.max_interval)
+        finally:
+            entry['status'] = status
+            elapsed = time.monotonic() - entry['started_at']
+            logging.info(f"Action {action_id} ({entry['type']}) finished with status {status} after {elapsed:.0f}s")
+            if state is not None:
+                state.in_flight_action = None
+                state.invalidate()
+            if not entry['future'].done():
+                entry['future'].set_result(status)
+            self.actions.pop(action_id, None)
+            self._tasks.pop(action_id, None)
+
+action_tracker = ActionTracker()
 
-def perform_droplet_action(action_type):
-    """Performs an action (power on, power off, reboot) on the droplet."""
-    url = f'https://api.digitalocean.com/v2/droplets/{DROPLET_ID}/actions'
-    headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {DIGITAL_OCEAN_KEY}'}
-    data = {'type': action_type}
-    response = requests.post(url, headers=headers, json=data)
+# --- DigitalOcean API Interactions ---
+async def perform_droplet_action(droplet, action_type):
+    """Performs an action (power on, power off, reboot) on the droplet.
 
-    if response.status_code == 201:
-        return "Action initiated successfully. ✅"
+    Returns the DigitalOcean action ID, which is tracked until it completes, or None on failure.
+    """
+    try:
+        status, data = await droplet.state.client.post(f'/droplets/{droplet.id}/actions', {'type': action_type})
+    except DigitalOceanError as e:
+        logging.error(f"Failed to perform action on {droplet.name}: {e}")
+        return None
+
+    if status == 201:
+        action_id = data['action']['id']
+        droplet.state.invalidate((action_type, None))
+        action_tracker.track(action_id, action_type, droplet.state)
+        return action_id
     else:
-        logging.error(f"Failed to perform action: {response.content.decode()}")
-        return f"❌ Failed to perform action."
-
-def resize_droplet(new_size):
-    """Resizes the droplet to a new size."""
-    url = f'https://api.digitalocean.com/v2/droplets/{DROPLET_ID}/actions'
-    headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {DIGITAL_OCEAN_KEY}'}
-    data = {'type': 'resize', 'size': new_size}
-    response = requests.post(url, headers=headers, json=data)
-
-    if response.status_code == 201:
-        return "Droplet resizing initiated successfully. ✅"
+        logging.error(f"Failed to perform action on {droplet.name}: {data}")
+        return None
+
+async def resize_droplet(droplet, new_size):
+    """Resizes the droplet to a new size.
+
+    Returns the DigitalOcean action ID, which is tracked until it completes, or None on failure.
+    """
+    try:
+        status, data = await droplet.state.client.post(f'/droplets/{droplet.id}/actions', {'type': 'resize', 'size': new_size})
+    except DigitalOceanError as e:
+        logging.error(f"Failed to resize {droplet.name}: {e}")
+        return None
+
+    if status == 201:
+        action_id = data['action']['id']
+        droplet.state.invalidate(('resize', new_size))
+        droplet.last_resize_time = time.time()
+        action_tracker.track(action_id, 'resize', droplet.state)
+        return action_id
     else:
-        logging.error(f"Failed to resize droplet: {response.content.decode()}")
-        return f"❌ Failed to resize droplet."
+        logging.error(f"Failed to resize {droplet.name}: {data}")
+        return None
+
+# --- Action Coordinator ---
+class ActionConflict(Exception):
+    """Raised when a droplet is already busy with a different action."""
+
+    def __init__(self, droplet, busy_with):
+        super().__init__(f"{droplet.name} is busy: {busy_with}")
+        self.busy_with = busy_with
+
+def describe_action(action_type, size=None):
+    return f"{action_type} to {size}" if size else action_type
+
+class ActionCoordinator:
+    """Serialises droplet actions, merging identical requests and rejecting ones that conflict with work in flight.
+
+    With a shared coordination backend this holds across replicas too: each droplet has a lease that is held while
+    an action is issued or an operation runs, and a record of the latest action issued on it.
+    """
+
+    def __init__(self, dedupe_window=ACTION_DEDUPE_WINDOW):
+        self.dedupe_window = dedupe_window
+        self.store = None  # Coordination backend shared with other replicas; None when this is the only one
+        self.locks = {}  # Droplet ID -> lock queueing submissions for that droplet
+        self.operations = {}  # Droplet ID -> claim held by a multi-step operation, e.g. resize then reboot
+        self.recent = {}  # Droplet ID -> (action_type, size, action ID, submitted at)
+
+    def in_flight(self, droplet):
+        """What the droplet is busy with, for display, or None when it is idle."""
+        claim = self.operations.get(droplet.id)
+        if claim is not None:
+            return claim['description']
+        if droplet.state.in_flight_action is not None:
+            return describe_action(*droplet.state.in_flight_action)
+        return None
+
+    @contextlib.asynccontextmanager
+    async def operation(self, droplet, description):
+        """Claims a droplet for several actions in a row; anyone else is rejected until it finishes."""
+        async with contextlib.AsyncExitStack() as stack:
+            async with self.locks.setdefault(droplet.id, asyncio.Lock()):
+                busy_with = self.in_flight(droplet)
+                if busy_with is not None:
+                    raise ActionConflict(droplet, busy_with)
+                await stack.enter_async_context(self._lease(droplet, description, operation=True))
+                record = await self._remote_action(droplet)
+                if record is not None and self._live(record):
+                    raise ActionConflict(droplet, describe_action(record['type'], record['size']))
+                claim = {'description': description}
+                self.operations[droplet.id] = claim
+            try:
+                yield claim
+            finally:
+                self.operations.pop(droplet.id, None)
+
+    async def submit(self, droplet, action_type, size=None, claim=None):
+        """Issues an action unless an identical one was just issued, here or on another replica.
+
+        Returns (action ID or None, merged), where merged means an earlier identical request's action was reused.
+        Raises ActionConflict if the droplet is busy with something else.
+        """
+        async with self.locks.setdefault(droplet.id, asyncio.Lock()), contextlib.AsyncExitStack() as stack:
+            recent = self.recent.get(droplet.id)
+            if recent is not None and recent[:2] == (action_type, size) and (
+                time.monotonic() - recent[3] < self.dedupe_window or droplet.state.in_flight_action == (action_type, size)
+            ):
+                logging.info(f"Merged duplicate {describe_action(action_type, size)} request for {droplet.name} into action {recent[2]}")
+                return recent[2], True
+            holder = self.operations.get(droplet.id)
+            if holder is not None and holder is not claim:
+                raise ActionConflict(droplet, holder['description'])
+            if droplet.state.in_flight_action is not None:
+                raise ActionConflict(droplet, describe_action(*droplet.state.in_flight_action))
+            if claim is None:  # An operation's claim already holds the lease
+                await stack.enter_async_context(self._lease(droplet, describe_action(action_type, size)))
+            record = await self._remote_action(droplet)
+            if record is not None:
+                live = self._live(record)
+                if (record['type'], record['size']) == (action_type, size) and (
+                    live or record['status'] == 'completed' and time.time() - record['at'] < self.dedupe_window
+                ):
+                    logging.info(f"Merged duplicate {describe_action(action_type, size)} request for {droplet.name} into action {record['id']} from another replica")
+                    if live:
+                        droplet.state.invalidate((action_type, size))
+                    action_tracker.track(record['id'], action_type, droplet.state)
+                    self.recent[droplet.id] = (action_type, size, record['id'], time.monotonic())
+                    return record['id'], True
+                if live:
+                    raise ActionConflict(droplet, describe_action(record['type'], record['size']))
+            if action_type == 'resize':
+                action_id = await resize_droplet(droplet, size)
+            else:
+                action_id = await perform_droplet_action(droplet, action_type)
+            if action_id is not None:
+                self.recent[droplet.id] = (action_type, size, action_id, time.monotonic())
+                record = {'id': action_id, 'type': action_type, 'size': size, 'at': time.time(), 'status': 'in-progress'}
+                await self._publish(droplet, record)
+                action_tracker.actions[action_id]['future'].add_done_callback(lambda future: self._finished(droplet, record, future))
+            return action_id, False
+
+    def _finished(self, droplet, record, future):
+        # A failed action must not swallow a retry as a duplicate
+        recent = self.recent.get(droplet.id)
+        if future.result() != 'completed' and recent is not None and recent[2] == record['id']:
+            del self.recent[droplet.id]
+        if self.store is not None:
+            asyncio.ensure_future(self._publish(droplet, {**record, 'status': future.result()}))
+
+    @contextlib.asynccontextmanager
+    async def _lease(self, droplet, description, operation=False):
+        """Holds the droplet's lease in the shared backend, renewing it until the block ends."""
+        if self.store is None:
+            yield
+            return
+        name, holder = f'droplet-{droplet.id}', f"{leader_election.node_id}-{uuid.uuid4().hex[:8]}"
+        for attempt in range(20):
+            if await self.store.acquire(name, holder, LEASE_SECONDS):
+                break
+            claim = await self.store.get(f'claim-{droplet.id}') or {}
+            if claim.get('operation') or attempt == 19:  # Otherwise another replica is only issuing an action; give it a few seconds
+                raise ActionConflict(droplet, claim.get('description', "an action on another replica"))
+            await asyncio.sleep(0.25)
+        renewal = None
+        try:
+            await self.store.put(f'claim-{droplet.id}', {'description': description, 'operation': operation})
+            renewal = asyncio.create_task(self._renew(name, holder))
+            yield
+        finally:
+            if renewal is not None:
+                renewal.cancel()
+            with contextlib.suppress(Exception):
+                await self.store.release(name, holder)
+
+    async def _renew(self, name, holder):
+        while True:
+            await asyncio.sleep(LEASE_SECONDS / 3)
+            try:
+                if not await self.store.acquire(name, holder, LEASE_SECONDS):
+                    logging.warning(f"Lost the {name} lease to another replica")
+            except Exception as e:
+                logging.error(f"Failed to renew the {name} lease: {e!r}")
+
+    async def _remote_action(self, droplet):
+        """The latest action another replica issued on the droplet, or None. Our own are tracked locally."""
+        if self.store is None:
+            return None
+        record = await self.store.get(f'action-{droplet.id}')
+        if record is None or record['node'] == leader_election.node_id:
+            return None
+        if self._live(record):
+            # Its replica may have stopped before recording the outcome, so ask DigitalOcean
+            try:
+                code, data = await droplet.state.client.get(f"/actions/{record['id']}")
+            except DigitalOceanError as e:
+                logging.warning(f"Failed to check action {record['id']}: {e}")
+            else:
+                if code == 200:
+                    record['status'] = data['action']['status']
+        return record
+
+    @staticmethod
+    def _live(record):
+        return record['status'] == 'in-progress' and time.time() - record['at'] < ACTION_TIMEOUT
+
+    async def _publish(self, droplet, record):
+        if self.store is None:
+            return
+        try:
+            await self.store.put(f'action-{droplet.id}', {**record, 'node': leader_election.node_id})
+        except Exception as e:
+            logging.error(f"Failed to share action {record['id']} on {droplet.name}: {e!r}")
+
+action_coordinator = ActionCoordinator()
+
+async def submit_and_wait(droplet, action_type, size=None, claim=None):
+    """Submits an action through the coordinator and waits for it; raises RuntimeError unless it completes."""
+    action_id, _ = await action_coordinator.submit(droplet, action_type, size, claim=claim)
+    if action_id is None:
+        raise RuntimeError(f"DigitalOcean rejected the {describe_action(action_type, size)}")
+    status = await action_tracker.wait(action_id)
+    if status != 'completed':
+        raise RuntimeError(f"{describe_action(action_type, size).capitalize()} finished with status '{status}'")
 
 # --- Discord Bot Functions ---
-async def send_embed(channel, title, description, color=discord.Color.blue()):
-    """Sends an embedded message to a Discord channel."""
-    embed = discord.Embed(title=title, description=description, color=color)
-    await channel.send(embed=embed)
+# Log lanes, most urgent first
+LOG_ERROR, LOG_INFO, LOG_QUIET = range(3)
+MAX_EMBEDS_PER_MESSAGE = 10  # Discord's limit
+
+class LogPipeline:
+    """Queues log-channel embeds and sends them in coalesced multi-embed messages, most urgent first."""
+
+    def __init__(self, channel_id, window=LOG_BATCH_WINDOW, limit=LOG_QUEUE_LIMIT, min_interval=LOG_MIN_INTERVAL):
+        self.channel_id = channel_id
+        self.window = window  # Seconds to wait for more events before sending a non-urgent batch
+        self.limit = limit  # Embeds queued before older, less urgent ones are dropped
+        self.min_interval = min_interval  # Seconds between messages, to stay clear of the channel rate limit
+        self.lanes = [deque() for _ in (LOG_ERROR, LOG_INFO, LOG_QUIET)]
+        self.dropped = {}  # Title -> embeds dropped since the last summary
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self._channel = None
+
+    def __len__(self):
+        return sum(len(lane) for lane in self.lanes)
+
+    def post(self, embed, priority=LOG_INFO):
+        """Queues an embed; under a flood the oldest, least urgent embed (possibly this one) is dropped."""
+        if len(self) >= self.limit:
+            lane = next((lane for lane in reversed(self.lanes[priority:]) if lane), None)
+            if lane is None:  # Everything queued is more urgent than this
+                self._count_drop(embed)
+                return
+            self._count_drop(lane.popleft())
+        self.lanes[priority].append(embed)
+        self.wakeup.set()
+
+    def _count_drop(self, embed):
+        self.dropped[embed.title] = self.dropped.get(embed.title, 0) + 1
+
+    def _summary(self):
+        lines = [f"{title} ×{count}" for title, count in sorted(self.dropped.items(), key=lambda item: -item[1])]
+        self.dropped = {}
+        return discord.Embed(
+            title="Log Messages Suppressed",
+            description="Dropped during a burst of events:\n" + "\n".join(lines)[:4000],
+            color=discord.Color.dark_grey(),
+        )
 
-async def check_active_players():
-    """Checks the number of active players on the server using the provided API."""
-    try:
-        response = requests.get(FX_API_URL + 'server-stats?page=0&perPage=20')
-        if response.status_code == 200:
-            data = response.json()
-            return sum(item['playerCount'] for item in data['items'])
+    def _take_batch(self):
+        room = MAX_EMBEDS_PER_MESSAGE - (1 if self.dropped else 0)
+        batch = []
+        for lane in self.lanes:
+            while lane and len(batch) < room:
+                batch.append(lane.popleft())
+        if self.dropped:
+            batch.append(self._summary())
+        return batch
+
+    async def channel(self):
+        """The log channel, resolved once and cached."""
+        if self._channel is None:
+            self._channel = bot.get_channel(self.channel_id) or await bot.fetch_channel(self.channel_id)
+        return self._channel
+
+    async def send_batch(self):
+        """Sends up to one message's worth of queued embeds."""
+        batch = self._take_batch()
+        if not batch or self.channel_id is None:  # No log channel configured for this tenant; discard the batch
+            return
+        try:
+            channel = await self.channel()
+            await channel.send(embeds=batch)
+        except (discord.NotFound, discord.Forbidden) as e:
+            self._channel = None  # Channel removed or access revoked; resolve it again next time
+            logging.error(f"Error sending {len(batch)} log embeds: {e}")
+        except discord.HTTPException as e:
+            logging.error(f"Error sending {len(batch)} log embeds: {e}")
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            if not self.lanes[LOG_ERROR]:  # Errors go out straight away; anything else waits for company
+                await asyncio.sleep(self.window)
+            self.wakeup.clear()
+            try:
+                await self.send_batch()
+            except Exception:
+                logging.exception("Unexpected error sending log embeds")  # Keep the sender alive for later events
+            await asyncio.sleep(self.min_interval)
+            if len(self):
+                self.wakeup.set()
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def flush(self):
+        """Stops the background sender and sends whatever is still queued."""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        while len(self) or self.dropped:
+            await self.send_batch()
+
+def log_event(title, description, color=discord.Color.blue(), priority=None, tenant=None):
+    """Queues an embed for a tenant's log channel; red embeds jump the queue unless a priority is given."""
+    if priority is None:
+        priority = LOG_ERROR if color == discord.Color.red() else LOG_INFO
+    (tenant or default_tenant).log.post(discord.Embed(title=title, description=description, color=color, timestamp=discord.utils.utcnow()), priority)
+
+# --- Player Count Poller ---
+class PlayerCountPoller:
+    """Fetches every page of the FX server-stats endpoint and keeps the latest counts in memory."""
+
+    def __init__(self, api_url, page_size=FX_PAGE_SIZE, ttl=PLAYER_SNAPSHOT_TTL, timeout=10):
+        self.api_url = api_url
+        self.page_size = page_size
+        self.ttl = ttl
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.total = 0
+        self.per_server = {}
+        self.updated_at = None  # time.monotonic() of the last successful fetch
+        self._lock = asyncio.Lock()
+
+    @property
+    def age(self):
+        """Seconds since the last successful fetch, or None if there has not been one."""
+        return None if self.updated_at is None else time.monotonic() - self.updated_at
+
+    @property
+    def is_fresh(self):
+        return self.updated_at is not None and self.age < self.ttl
+
+    async def _fetch_page(self, session, page):
+        params = {'page': page, 'perPage': self.page_size}
+        async with session.get(self.api_url + 'server-stats', params=params, timeout=self.timeout) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    def _page_count(self, data):
+        """Number of pages reported by the API, or None if it does not say."""
+        if data.get('totalPages') is not None:
+            return int(data['totalPages'])
+        if data.get('total') is not None:
+            return max(1, -(-int(data['total']) // self.page_size))
+        return None
+
+    async def _fetch_all(self):
+        session = await get_http_session()
+        first = await self._fetch_page(session, 0)
+        items = list(first.get('items', []))
+        pages = self._page_count(first)
+        if pages is not None:
+            rest = await asyncio.gather(*(self._fetch_page(session, page) for page in range(1, pages)))
+            for data in rest:
+                items.extend(data.get('items', []))
         else:
-            logging.error(f"Failed to fetch player data. Status code: {response.status_code}")
-            return 0
-    except Exception as e:
-        logging.error(f"Error fetching player data: {str(e)}")
-        return 0
+            # No page count in the response; keep walking while pages come back full
+            page, last = 1, first.get('items', [])
+            while len(last) >= self.page_size:
+                last = (await self._fetch_page(session, page)).get('items', [])
+                items.extend(last)
+                page += 1
+        return items
+
+    async def refresh(self, force=True):
+        """Fetches all pages and replaces the snapshot. Concurrent callers share a single upstream fetch."""
+        async with self._lock:
+            if not force and self.is_fresh:
+                return
+            try:
+                items = await self._fetch_all()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logging.error(f"Error fetching player data: {str(e)}")
+                return
+            per_server = {}
+            for index, item in enumerate(items):
+                key = item.get('id') or item.get('name') or index
+                per_server[key] = per_server.get(key, 0) + item.get('playerCount', 0)
+            self.per_server = per_server
+            self.total = sum(per_server.values())
+            self.updated_at = time.monotonic()
+
+    async def get_total(self):
+        """Returns the total player count, refreshing first only if the snapshot is stale."""
+        fresh = self.is_fresh
+        telemetry.inc('fxbot_cache_requests_total', cache='player_counts', result='hit' if fresh else 'miss')
+        if not fresh:
+            await self.refresh(force=False)
+        return self.total
+
+    def snapshot(self):
+        """The latest counts with a wall-clock fetch time, for other replicas to absorb."""
+        return {'per_server': self.per_server, 'total': self.total, 'updated_at': time.time() - self.age}
+
+    def absorb(self, snapshot):
+        """Adopts another replica's counts if they are newer than ours."""
+        updated_at = time.monotonic() - (time.time() - snapshot['updated_at'])
+        if self.updated_at is not None and updated_at <= self.updated_at:
+            return
+        self.per_server, self.total, self.updated_at = snapshot['per_server'], snapshot['total'], updated_at
+
+# --- Fleet ---
+def parse_hhmm(value):
+    """Parses 'HH:MM' into an (hour, minute) tuple."""
+    hour, minute = value.split(':')
+    return int(hour), int(minute)
+
+class LoadSeries:
+    """Rolling time series of player counts and, where available, host CPU/RAM usage."""
+
+    def __init__(self, window=AUTOSCALE_WINDOW):
+        self.window = window
+        self.samples = deque()  # (timestamp, players, cpu %, ram %)
+
+    def add(self, players, cpu=None, ram=None, timestamp=None):
+        timestamp = timestamp or time.time()
+        self.samples.append((timestamp, players, cpu, ram))
+        while self.samples and self.samples[0][0] < timestamp - self.window:
+            self.samples.popleft()
+
+    def __len__(self):
+        return len(self.samples)
+
+    def peak_players(self):
+        return max((sample[1] for sample in self.samples), default=0)
+
+    def mean(self, index):
+        """Mean of one sample field (2 = CPU, 3 = RAM) over the window, or None if never measured."""
+        values = [sample[index] for sample in self.samples if sample[index] is not None]
+        return sum(values) / len(values) if values else None
+
+class Droplet:
+    """A managed droplet with its own plan ladder, schedule and player-count source."""
+
+    def __init__(self, droplet_id, name, plans, schedule, tz, players, server_ip,
+                 capacity=None, min_plan=MIN_PLAN, host_metrics=False, game_port=GAME_PORT, tenant=None):
+        self.id = str(droplet_id)
+        self.tenant = tenant
+        self.name = name
+        self.plans = plans
+        self.schedule = sorted((parse_hhmm(entry['from']), entry['plan']) for entry in schedule)
+        self.timezone = pytz.timezone(tz)
+        self.players = players
+        self.server_ip = server_ip
+        self.game_port = game_port
+        self.capacity = {**DEFAULT_CAPACITY, **(capacity or {})}
+        self.min_plan = min_plan
+        self.host_metrics = host_metrics  # True when the bot runs on this droplet and psutil sees its load
+        self.state = DropletStateCache(self.id, client=tenant.client if tenant else do_client)
+        self.state.size_listeners.append(lambda size_slug: cost_engine.record_transition(self, size_slug))
+        self.load = LoadSeries()
+        self.last_resize_time = None
+        self.servers_not_resizing_count = 0
+
+    def tier_of(self, size_slug):
+        """Returns the plan tier name for a size slug, or None if it is not on the ladder."""
+        for tier in PLAN_ORDER:
+            if self.plans.get(tier) == size_slug:
+                return tier
+        return None
+
+    def local_time(self):
+        return datetime.now(self.timezone)
+
+    def scheduled_plan(self, now=None):
+        """Returns the plan slug the schedule asks for at the given local time."""
+        now = now or self.local_time()
+        tier = self.schedule[-1][1]  # Before the first entry, yesterday's last entry still applies
+        for start, plan in self.schedule:
+            if start <= (now.hour, now.minute):
+                tier = plan
+        return self.plans[tier]
+
+    def next_schedule_change(self, now=None):
+        """Returns (local datetime, tier) of the next schedule entry that changes the plan, or None."""
+        now = now or self.local_time()
+        current = self.scheduled_plan(now)
+        for days in (0, 1):
+            for (hour, minute), tier in self.schedule:
+                day = now.date() + timedelta(days=days)
+                at = self.timezone.localize(datetime(day.year, day.month, day.day, hour, minute))
+                if at > now and self.plans[tier] != current:
+                    return at, tier
+        return None
+
+player_sources = {}
+
+def get_player_source(api_url):
+    """Returns the poller for an FX API URL, shared by every droplet reporting through it."""
+    if api_url not in player_sources:
+        player_sources[api_url] = PlayerCountPoller(api_url)
+    return player_sources[api_url]
+
+def build_fleet(settings, tenant=None):
+    """Builds a tenant's droplets from its settings, falling back to its single droplet_id.
+
+    Anything a tenant section leaves out is inherited from the top-level config, except its droplets:
+    a tenant that inherited them could resize another community's servers.
+    """
+    if settings is not config and not settings.get('droplets') and not settings.get('droplet_id'):
+        raise ValueError(f"Tenant {settings.get('guild_id')} must set droplet_id or droplets")
+    entries = settings.get('droplets') or [{'id': settings.get('droplet_id', DROPLET_ID), 'name': 'main'}]
+    tenant_plans = settings.get('plans', {}) if settings is not config else {}  # PLANS already has the top-level ones
+    droplets = {}
+    for entry in entries:
+        droplet = Droplet(
+            entry['id'],
+            entry.get('name', str(entry['id'])),
+            {**PLANS, **tenant_plans, **entry.get('plans', {})},
+            entry.get('schedule', settings.get('schedule', config.get('schedule', DEFAULT_SCHEDULE))),
+            entry.get('timezone', settings.get('timezone', TIMEZONE)),
+            get_player_source(entry.get('fx_api_url', settings.get('fx_api_url', FX_API_URL))),
+            entry.get('server_ip', settings.get('server_ip', SERVER_IP)),
+            capacity=entry.get('capacity', settings.get('capacity', config.get('capacity'))),
+            min_plan=entry.get('min_plan', settings.get('min_plan', MIN_PLAN)),
+            host_metrics=entry.get('host_metrics', False),
+            game_port=entry.get('game_port', settings.get('game_port', GAME_PORT)),
+            tenant=tenant,
+        )
+        droplets[droplet.id] = droplet
+    return droplets
+
+# --- Tenants ---
+PERMISSION_KEYS = {'droplet_perms', 'authorized_users', 'restart_perms'}
+
+class Tenant:
+    """One community served by this process: its guild, droplets, permissions, log channel and DigitalOcean account.
+
+    The top-level config is the default tenant; each entry in the config's `tenants` list is another,
+    keyed by `guild_id`, with its DigitalOcean token under the same guild ID in keys.json.
+    """
+
+    def __init__(self, guild_id=None, is_default=False):
+        self.guild_id = guild_id
+        self.is_default = is_default  # The default tenant also answers guilds no other tenant claims, unless it names its own
+        settings = self.settings
+        self.name = settings.get('name', 'main' if is_default else str(guild_id))
+        token = DIGITAL_OCEAN_KEY if is_default else keys.get('tenants', {}).get(str(guild_id), {}).get('digital_ocean_key', DIGITAL_OCEAN_KEY)
+        self.client = do_client if token == DIGITAL_OCEAN_KEY else DigitalOceanClient(token)
+        self.permissions = PermissionEngine()
+        self.permissions.rebuild(settings)
+        self.log = LogPipeline(settings.get('log_channel_id', LOG_CHANNEL_ID if is_default else None))
+        self.fleet = build_fleet(settings, self)
+        self.primary = next(iter(self.fleet.values()))
+        self.disable_resizing = False
+        self.view = None  # DropletManagementView listing this tenant's droplets; needs a running loop to create
+        self.dashboard = None
+
+    @property
+    def settings(self):
+        """This tenant's config section (the whole config for the default tenant)."""
+        if self.is_default:
+            return config
+        return next((entry for entry in config.get('tenants', []) if entry.get('guild_id') == self.guild_id), {})
+
+    def update_settings(self, **values):
+        """Writes keys into this tenant's config section through the config store."""
+        if self.is_default:
+            config_store.update(**values)
+            return
+        entries = [{**entry, **values} if entry.get('guild_id') == self.guild_id else entry for entry in config.get('tenants', [])]
+        config_store.update(tenants=entries)
+
+default_tenant = Tenant(config.get('guild_id'), is_default=True)
+tenants = {default_tenant.guild_id: default_tenant}
+for tenant_entry in config.get('tenants', []):
+    tenants[tenant_entry['guild_id']] = Tenant(tenant_entry['guild_id'])
+fleet = {}  # Every tenant's droplets
+for tenant in tenants.values():
+    for droplet in tenant.fleet.values():
+        if droplet.id in fleet:  # Two autoscalers would fight over it
+            raise ValueError(f"Droplet {droplet.id} is configured for both {fleet[droplet.id].tenant.name} and {tenant.name}")
+        fleet[droplet.id] = droplet
+
+def tenant_for_guild(guild_id):
+    """The tenant serving a guild, or None if this process does not serve it."""
+    tenant = tenants.get(guild_id)
+    if tenant is None and default_tenant.guild_id is None:
+        return default_tenant
+    return tenant
+
+def tenant_for(context):
+    """The tenant an Interaction or command Context belongs to."""
+    if isinstance(context, discord.Interaction):
+        return tenant_for_guild(context.guild_id)
+    return tenant_for_guild(context.guild.id if context.guild else None)
+
+def tenant_of_job(job):
+    """The tenant a scheduled job belongs to, or None if its guild is no longer served.
+
+    Jobs from before tenants existed have no guild and belong to the default tenant.
+    """
+    guild_id = job['args'].get('guild')
+    return default_tenant if guild_id is None else tenants.get(guild_id)
+
+# Keys the running bot applies as soon as they change; the rest need a restart
+HOT_RELOADED_KEYS = {
+    'droplet_perms', 'authorized_users', 'restart_perms', 'plans', 'prices', 'schedule', 'capacity', 'droplets', 'check_interval',
+    'dashboard', 'log_channel_id', 'tenants',
+}
+
+@config_store.subscribe
+def apply_fleet_changes(changes):
+    """Pushes edited permissions, log channels, plans, prices, schedules and capacities into the running tenants."""
+    if 'plans' in changes:
+        PLANS.clear()
+        PLANS.update({**DEFAULT_PLANS, **config.get('plans', {})})
+    if 'prices' in changes:
+        PLAN_PRICES.clear()
+        PLAN_PRICES.update({**DEFAULT_PRICES, **config.get('prices', {})})
+    if 'tenants' in changes and {entry.get('guild_id') for entry in config.get('tenants', [])} != tenants.keys() - {default_tenant.guild_id}:
+        logging.warning("Tenants were added or removed in the config; restart the bot to serve them")
+    for tenant in tenants.values():
+        if changes.keys() & PERMISSION_KEYS or 'tenants' in changes:
+            tenant.permissions.rebuild(tenant.settings)
+        if changes.keys() & {'log_channel_id', 'tenants'} and tenant.log.channel_id != tenant.settings.get('log_channel_id', tenant.log.channel_id):
+            tenant.log.channel_id = tenant.settings['log_channel_id']
+            tenant.log._channel = None
+        if not changes.keys() & {'plans', 'schedule', 'capacity', 'droplets', 'tenants'}:
+            continue
+        rebuilt = build_fleet(tenant.settings, tenant)
+        if rebuilt.keys() != tenant.fleet.keys():
+            logging.warning(f"Droplets were added or removed for {tenant.name}; restart the bot to manage them")
+        for droplet_id, droplet in tenant.fleet.items():
+            if droplet_id in rebuilt:
+                droplet.plans = rebuilt[droplet_id].plans
+                droplet.schedule = rebuilt[droplet_id].schedule
+                droplet.capacity = rebuilt[droplet_id].capacity
+    if 'check_interval' in changes and isinstance(config.get('check_interval'), int):
+        monitor_server.change_interval(seconds=config['check_interval'])
+    pending_restart = sorted(changes.keys() - HOT_RELOADED_KEYS)
+    if pending_restart:
+        logging.warning(f"Config changes to {', '.join(pending_restart)} take effect after a restart")
+
+@tasks.loop(seconds=CONFIG_WATCH_INTERVAL)
+async def watch_config():
+    """Hot-reloads edits made to the config file outside the bot."""
+    config_store.check()
+
+def find_droplets(target, tenant=None):
+    """Resolves a droplet name or ID within a tenant's fleet; '*' means the whole fleet and None the primary droplet."""
+    tenant = tenant or default_tenant
+    if not target:
+        return [tenant.primary]
+    if target == '*':
+        return list(tenant.fleet.values())
+    return [droplet for droplet in tenant.fleet.values() if target in (droplet.id, droplet.name)][:1]
+
+async def run_bounded(items, func, limit=MAX_CONCURRENT_DROPLETS):
+    """Runs func over items concurrently, at most `limit` at a time, returning results (or exceptions) in order."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(item):
+        async with semaphore:
+            return await func(item)
+
+    return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+
+async def run_fair(groups, func, limit=MAX_CONCURRENT_DROPLETS, per_group=MAX_CONCURRENT_PER_TENANT):
+    """Runs func over every item of several groups, taking items round-robin across groups.
+
+    At most `limit` items run at once and at most `per_group` from any one group, so a large group
+    cannot starve the others. Returns {item: result or exception}.
+    """
+    semaphore = asyncio.Semaphore(limit)
+    group_semaphores = [asyncio.Semaphore(per_group) for _ in groups]
+    queues = [deque(items) for items in groups]
+    order = []
+    while any(queues):
+        for index, queue in enumerate(queues):
+            if queue:
+                order.append((index, queue.popleft()))
+
+    async def run(index, item):
+        async with group_semaphores[index], semaphore:
+            return await func(item)
+
+    results = await asyncio.gather(*(run(index, item) for index, item in order), return_exceptions=True)
+    return {item: result for (_, item), result in zip(order, results)}
+
+async def check_active_players(droplet=None, tenant=None):
+    """Returns the number of active players for a droplet, or a tenant's whole fleet, from the shared snapshots."""
+    if droplet is not None:
+        return await droplet.players.get_total()
+    sources = {droplet.players for droplet in (tenant or default_tenant).fleet.values()}
+    return sum(await asyncio.gather(*(source.get_total() for source in sources)))
+
+@tasks.loop(seconds=PLAYER_POLL_INTERVAL)
+async def poll_players():
+    """Keeps the player-count snapshots warm and records a load sample for every droplet."""
+    await asyncio.gather(*(source.refresh() for source in player_sources.values()))
+    for droplet in fleet.values():
+        if droplet.players.updated_at is None:
+            continue
+        cpu = ram = None
+        if droplet.host_metrics:
+            import psutil
+            cpu, ram = psutil.cpu_percent(interval=None), psutil.virtual_memory().percent
+        droplet.load.add(droplet.players.total, cpu, ram)
+        forecaster.observe(droplet, droplet.players.total)
+        metrics_store.record('players', droplet.id, droplet.players.total)
+        if cpu is not None:
+            metrics_store.record('cpu', droplet.id, cpu)
+            metrics_store.record('ram', droplet.id, ram)
+    if forecaster.dirty:
+        await asyncio.to_thread(forecaster.save)
+
+# --- Autoscaler ---
+class Autoscaler:
+    """Picks a plan tier from observed load against per-plan capacity, with hysteresis and a cooldown."""
+
+    def __init__(self, hysteresis=SCALE_DOWN_HYSTERESIS, cooldown=RESIZE_COOLDOWN, scale_up_cooldown=SCALE_UP_COOLDOWN):
+        self.hysteresis = hysteresis
+        self.cooldown = cooldown
+        self.scale_up_cooldown = scale_up_cooldown
+
+    def required_tier(self, droplet, load, headroom=0.0):
+        """Smallest tier (not below the droplet's minimum) whose capacity, less headroom, fits the load."""
+        candidates = PLAN_ORDER[PLAN_ORDER.index(droplet.min_plan):]
+        for tier in candidates:
+            if droplet.capacity[tier] * (1 - headroom) >= load:
+                return tier
+        return candidates[-1]
+
+    def decide(self, droplet, current_tier, forecast=None, now=None):
+        """Returns (target tier, reason), or None if there is neither load history nor a forecast to go on.
+
+        forecast is the predicted peak player count over the time it would take a resize to land.
+        """
+        if not len(droplet.load) and forecast is None:
+            return None
+        now = now or time.time()
+        load = droplet.load.peak_players()
+        reason = f"peak {load} players over {droplet.load.window // 60} min"
+        if forecast is not None and forecast > load:
+            load = forecast
+            reason = f"forecast peak of {forecast:.0f} players"
+        cpu, ram = droplet.load.mean(2), droplet.load.mean(3)
+        if current_tier is None:
+            return self.required_tier(droplet, load), f"current size not on the plan ladder; {reason}"
+
+        current = PLAN_ORDER.index(current_tier)
+        since_resize = now - droplet.last_resize_time if droplet.last_resize_time else None
+
+        target = PLAN_ORDER.index(self.required_tier(droplet, load))
+        if (cpu is not None and cpu >= CPU_SCALE_UP) or (ram is not None and ram >= RAM_SCALE_UP):
+            target = max(target, min(current + 1, len(PLAN_ORDER) - 1))
+            pressure = ", ".join(f"{name} {value:.0f}%" for name, value in (('CPU', cpu), ('RAM', ram)) if value is not None)
+            reason = f"host under pressure ({pressure})"
+        if target > current:
+            if since_resize is not None and since_resize < self.scale_up_cooldown:
+                return current_tier, "scale-up cooldown"
+            return PLAN_ORDER[target], reason
+
+        # Only drop a tier once the load fits it with headroom to spare
+        target = PLAN_ORDER.index(self.required_tier(droplet, load, self.hysteresis))
+        if target < current:
+            if cpu is not None and cpu > CPU_SCALE_DOWN:
+                return current_tier, f"host CPU at {cpu:.0f}%"
+            if since_resize is not None and since_resize < self.cooldown:
+                return current_tier, "scale-down cooldown"
+            return PLAN_ORDER[target], reason
+        return current_tier, reason
+
+autoscaler = Autoscaler()
+
+# --- Occupancy Forecaster ---
+class OccupancyForecaster:
+    """Learns day-of-week x time-of-day occupancy profiles as exponentially weighted per-slot peaks."""
+
+    def __init__(self, path=FORECAST_FILE, slot_minutes=FORECAST_SLOT_MINUTES, alpha=FORECAST_ALPHA, lead_time=RESIZE_LEAD_TIME):
+        self.path = path
+        self.slot_minutes = slot_minutes
+        self.alpha = alpha
+        self.lead_time = lead_time  # Seconds, refined from observed resize durations
+        self.profiles = {}  # Droplet ID -> {slot: weighted peak players}
+        self._open_slots = {}  # Droplet ID -> (slot, peak so far) for the slot being observed
+        self.dirty = False
+
+    def slot_of(self, local_time):
+        slots_per_day = 24 * 60 // self.slot_minutes
+        return local_time.weekday() * slots_per_day + (local_time.hour * 60 + local_time.minute) // self.slot_minutes
+
+    def observe(self, droplet, players, local_time=None):
+        """Records a player count; each slot's peak is folded into its average once the slot ends."""
+        slot = self.slot_of(local_time or droplet.local_time())
+        open_slot, peak = self._open_slots.get(droplet.id, (slot, 0))
+        if open_slot != slot:
+            self._fold(droplet.id, open_slot, peak)
+            peak = 0
+        self._open_slots[droplet.id] = (slot, max(peak, players))
+
+    def _fold(self, droplet_id, slot, peak):
+        profile = self.profiles.setdefault(droplet_id, {})
+        average = profile.get(slot)
+        profile[slot] = peak if average is None else self.alpha * peak + (1 - self.alpha) * average
+        self.dirty = True
+
+    def record_resize_duration(self, seconds):
+        """Folds an observed decide-to-ready resize duration into the lead time."""
+        self.lead_time = self.alpha * seconds + (1 - self.alpha) * self.lead_time
+
+    def predict(self, droplet, start, end):
+        """Predicted peak players between two local times, or None if the profile has no data for that range."""
+        profile = self.profiles.get(droplet.id, {})
+        slots_per_week = 7 * 24 * 60 // self.slot_minutes
+        first = self.slot_of(start)
+        count = (self.slot_of(end) - first) % slots_per_week + 1  # Every slot touched, wrapping past Sunday night
+        predictions = [profile[slot % slots_per_week] for slot in range(first, first + count) if slot % slots_per_week in profile]
+        return max(predictions) if predictions else None
+
+    def horizon(self, droplet, now=None):
+        """Predicted peak to size for now: over the time a resize decided now would take to land.
+
+        Resizing reboots the server, so it waits until the server is empty. If players are predicted to arrive
+        before the next chance to resize would finish, this is the last empty window, so the peak of the whole
+        session they start counts too.
+        """
+        now = now or droplet.local_time()
+        peak = self.predict(droplet, now, now + timedelta(seconds=self.lead_time + CHECK_INTERVAL))
+        profile = self.profiles.get(droplet.id, {})
+        slots_per_week = 7 * 24 * 60 // self.slot_minutes
+        first = self.slot_of(now)
+        last_chance = (self.slot_of(now + timedelta(seconds=self.lead_time + 2 * CHECK_INTERVAL)) - first) % slots_per_week
+        session = []
+        for offset in range(24 * 60 // self.slot_minutes):  # Look at most a day ahead
+            players = profile.get((first + offset) % slots_per_week)
+            if players is None or players <= 1:
+                if session or offset >= last_chance:
+                    break  # The session ended, or nobody arrives before a later check could still resize
+                continue
+            session.append(players)
+        if session:
+            peak = max(peak or 0, max(session))
+        return peak
+
+    def load(self):
+        """Loads saved profiles from disk, if any."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            data = load_json(self.path)
+        except ValueError as e:  # Left truncated by a crash mid-write; the profiles are relearned
+            logging.error(f"Ignoring unreadable {self.path}: {e}")
+            return
+        self.lead_time = data.get('lead_time', self.lead_time)
+        self.profiles = {droplet_id: {int(slot): value for slot, value in profile.items()}
+                         for droplet_id, profile in data.get('profiles', {}).items()}
+
+    def save(self):
+        """Writes the profiles to disk."""
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'lead_time': self.lead_time, 'profiles': self.profiles}, f)
+        os.replace(temp_path, self.path)
+        self.dirty = False
+
+forecaster = OccupancyForecaster()
+
+async def seed_forecaster():
+    """Backfills empty occupancy profiles from the player history in the metrics store."""
+    for droplet in fleet.values():
+        if forecaster.profiles.get(droplet.id):
+            continue
+        rows = await metrics_store.query('players', droplet.id, time.time() - METRICS_RETENTION['5m'] * 86400)
+        for ts, _, _, peak, _ in rows:
+            forecaster.observe(droplet, peak, datetime.fromtimestamp(ts, droplet.timezone))
+        if rows:
+            logging.info(f"Seeded occupancy forecast for {droplet.name} from {len(rows)} stored samples")
+
+# --- Cost Accounting ---
+class CostEngine:
+    """Records plan transitions and turns them into plan-hours and spend."""
+
+    def __init__(self, store=metrics_store, prices=PLAN_PRICES, baseline_plan=BASELINE_PLAN):
+        self.store = store
+        self.prices = prices
+        self.baseline_plan = baseline_plan
+        self.transitions = {}  # Droplet ID -> [(ts, size slug)] in time order
+
+    async def load(self):
+        """Loads recorded transitions from the metrics store."""
+        for ts, series, detail in await self.store.events('plan', 0):
+            self.transitions.setdefault(series, []).append((ts, detail['size']))
+
+    def record_transition(self, droplet, size_slug, timestamp=None):
+        """Records that a droplet is now on a plan, unless that is already the last recorded plan."""
+        history = self.transitions.setdefault(droplet.id, [])
+        if size_slug == "Unknown" or (history and history[-1][1] == size_slug):
+            return
+        timestamp = int(timestamp or time.time())
+        history.append((timestamp, size_slug))
+        self.store.record_event('plan', droplet.id, timestamp=timestamp, size=size_slug)
+
+    def plan_hours(self, droplet, start, end):
+        """Returns {size slug: hours} spent between two UNIX times, counting only time since tracking began."""
+        hours = {}
+        history = self.transitions.get(droplet.id, [])
+        for index, (ts, size_slug) in enumerate(history):
+            until = history[index + 1][0] if index + 1 < len(history) else end
+            overlap = min(until, end) - max(ts, start)
+            if overlap > 0:
+                hours[size_slug] = hours.get(size_slug, 0) + overlap / 3600
+        return hours
+
+    def spend(self, droplet, start, end):
+        """Returns (actual USD, always-baseline USD, tracked hours) between two UNIX times."""
+        hours = self.plan_hours(droplet, start, end)
+        actual = sum(self.prices.get(size_slug, 0) * value for size_slug, value in hours.items())
+        tracked = sum(hours.values())
+        baseline = self.prices.get(droplet.plans.get(self.baseline_plan), 0) * tracked
+        return actual, baseline, tracked
+
+    def fleet_spend(self, start, end, droplets=None):
+        totals = [self.spend(droplet, start, end) for droplet in (droplets if droplets is not None else fleet.values())]
+        return tuple(sum(values) for values in zip(*totals)) if totals else (0.0, 0.0, 0.0)
+
+    def projected_monthly(self, droplet=None, droplets=None):
+        """Projects a month (730 h) of spend from the last 7 days' average hourly cost."""
+        now = time.time()
+        droplets = list(droplets if droplets is not None else fleet.values())
+        actual, _, tracked = self.spend(droplet, now - 7 * 86400, now) if droplet else self.fleet_spend(now - 7 * 86400, now, droplets)
+        if droplet is None:
+            tracked /= max(len(droplets), 1)
+        return actual / tracked * 730 if tracked else 0.0
+
+    def daily(self, days=7, tz=TIMEZONE, droplets=None):
+        """Returns [(date, actual USD, baseline USD)] for the last few local calendar days, today included."""
+        zone = pytz.timezone(tz)
+        today = datetime.now(zone).date()
+        rows = []
+        for offset in range(days - 1, -1, -1):
+            day = today - timedelta(days=offset)
+            day_start = zone.localize(datetime(day.year, day.month, day.day)).timestamp()
+            next_day = day + timedelta(days=1)
+            day_end = min(zone.localize(datetime(next_day.year, next_day.month, next_day.day)).timestamp(), time.time())
+            actual, baseline, _ = self.fleet_spend(day_start, day_end, droplets)
+            rows.append((day, actual, baseline))
+        return rows
+
+cost_engine = CostEngine()
 
 # --- Discord Views for Interactions ---
 class ConfirmationView(ui.View):
     """View for confirmation buttons."""
 
-    def __init__(self, action_type, size=None):
+    def __init__(self, action_type, plan=None, droplets=None):
         super().__init__(timeout=30)
         self.action_type = action_type
-        self.size = size
+        self.plan = plan
+        self.droplets = droplets or [default_tenant.primary]
+        instrument_view(self)
+
+    async def run_action(self, droplet):
+        """Runs the confirmed action against one droplet and returns a status message."""
+        size = droplet.plans[self.plan] if self.action_type == "resize" else None
+        try:
+            action_id, merged = await action_coordinator.submit(droplet, self.action_type, size)
+        except ActionConflict as e:
+            return f"⏳ Not started; {e}."
+        if merged:
+            return "Already in progress. ✅"
+        if self.action_type == "resize":
+            return "Droplet resizing initiated successfully. ✅" if action_id else "❌ Failed to resize droplet."
+        return "Action initiated successfully. ✅" if action_id else "❌ Failed to perform action."
 
     @ui.button(label="Confirm", style=discord.ButtonStyle.success)
     async def confirm(self, interaction: discord.Interaction, button: discord.ui.Button):
-        global current_plan
-        message = ""
-        if self.action_type == "resize":
-            message = resize_droplet(self.size)
-            if "successfully" in message:
-                current_plan = self.size
+        await interaction.response.defer()  # Acknowledge before the DigitalOcean round trip
+        results = await run_bounded(self.droplets, self.run_action)
+        results = [result if isinstance(result, str) else f"❌ {result}" for result in results]
+        if len(self.droplets) == 1:
+            message = results[0]
         else:
-            message = perform_droplet_action(self.action_type)
-        await interaction.response.send_message(message, ephemeral=False)
+            message = "\n".join(f"**{droplet.name}**: {result}" for droplet, result in zip(self.droplets, results))
+        await interaction.followup.send(message, ephemeral=False)
         self.stop()
 
     @ui.button(label="Cancel", style=discord.ButtonStyle.danger)
@@ -175,50 +1981,71 @@ class ConfirmationView(ui.View):
         self.stop()
 
 class DropletManagementView(ui.View):
-    """View for droplet management buttons."""
-
-    def __init__(self):
-        super().__init__(timeout=None)
+    """View for droplet management buttons.
 
-    async def check_permissions(self, interaction):
-        """Checks if the user has permission to interact with the view."""
-        user_roles = [role.id for role in interaction.user.roles]
-        has_permission = (
-            not droplet_perms and not authorized_users or
-            any(role in droplet_perms for role in user_roles) or
-            interaction.user.id in authorized_users
-        )
-        if not has_permission:
-            await interaction.response.send_message("You do not have permission to use this.", ephemeral=True)
-        return has_permission
+    Pass a tenant to render its droplets in the target menu; without one the view lists every tenant's
+    droplets, which is what the persistent view that handles every guild's clicks needs.
+    """
 
-    async def ask_for_confirmation(self, interaction, action_type, size=None):
+    def __init__(self, tenant=None):
+        super().__init__(timeout=None)
+        self.targets = {}  # (guild ID, user ID) -> droplet ID, or '*' for the whole fleet
+        droplets = tenant.fleet if tenant is not None else fleet
+        if len(droplets) > 1:
+            self.select_target.options = [discord.SelectOption(label="Whole fleet", value='*', emoji="🌐")] + [
+                discord.SelectOption(label=droplet.name, value=droplet.id, description=droplet.id)
+                for droplet in list(droplets.values())[:24]
+            ]
+        else:
+            self.remove_item(self.select_target)
+        instrument_view(self)
+
+    async def interaction_check(self, interaction):
+        if not handles_events():
+            return False  # Another replica answers this one
+        if tenant_for(interaction) is None:
+            await interaction.response.send_message("This server is not managed by this bot.", ephemeral=True)
+            return False
+        return True
+
+    def target_droplets(self, interaction):
+        """Returns the droplets the user has selected, defaulting to their tenant's primary droplet."""
+        tenant = tenant_for(interaction)
+        return find_droplets(self.targets.get((interaction.guild_id, interaction.user.id)), tenant) or [tenant.primary]
+
+    async def ask_for_confirmation(self, interaction, action_type, plan=None):
         """Presents a confirmation dialog to the user."""
-        view = ConfirmationView(action_type, size)
+        tenant = tenant_for(interaction)
+        droplets = self.target_droplets(interaction)
+        busy = [f"{droplet.name}: {busy_with}" for droplet in droplets if (busy_with := action_coordinator.in_flight(droplet))]
+        if len(busy) == len(droplets):
+            await interaction.response.send_message(f"⏳ Already in progress ({'; '.join(busy)}). Try again once it finishes.", ephemeral=True)
+            return
+        view = ConfirmationView(action_type, plan, droplets)
+        target = "the droplet" if len(tenant.fleet) == 1 else ", ".join(droplet.name for droplet in droplets)
         try:
-            if size is not None:
+            if plan is not None:
                 if action_type == "resize":
-                    cost_mapping = {
-                        "s-1vcpu-2gb-intel": "0.024",
-                        "s-2vcpu-4gb-amd": "0.042",
-                        "s-4vcpu-8gb-amd": "0.083",
-                        "s-4vcpu-16gb-amd": "0.125",
-                        "s-v8cpu-16gb-amd": "0.167"
-                    }
-                    target_cost = cost_mapping.get(size)
-
-                    if target_cost is None:
-                        raise ValueError(f"Invalid size provided: {size}")
-
+                    target_cost = 0.0
+                    for droplet in droplets:
+                        size = droplet.plans.get(plan)
+                        if PLAN_PRICES.get(size) is None:
+                            raise ValueError(f"Invalid size provided: {size}")
+                        target_cost += PLAN_PRICES[size]
+
+                    if len(droplets) == 1:
+                        change = f"from {droplets[0].state.size_slug} to {droplets[0].plans[plan]}"
+                    else:
+                        change = f"to the {plan} plan"
                     await interaction.response.send_message(
-                        f"Are you sure you want to {action_type} the droplet to {size}? This will cost {target_cost} USD/h",
+                        f"Are you sure you want to {action_type} {target} {change}? This will cost {target_cost:g} USD/h",
                         ephemeral=False,
                         view=view
                     )
                     return
 
             await interaction.response.send_message(
-                f"Are you sure you want to {action_type} the droplet?",
+                f"Are you sure you want to {action_type} {target}?",
                 ephemeral=False,
                 view=view
             )
@@ -232,193 +2059,1114 @@ class DropletManagementView(ui.View):
 
     # Button Definitions for Droplet Management
     @ui.button(label="Super Usage (8vcpu-16gb)", style=discord.ButtonStyle.primary, custom_id="resize_super")
+    @requires('panel', "You do not have permission to use this.")
     async def resize_super(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if await self.check_permissions(interaction):
-            await self.ask_for_confirmation(interaction, "resize", PLANS["ultra"])
+        await self.ask_for_confirmation(interaction, "resize", "ultra")
 
     @ui.button(label="Peak Usage (4vcpu-16gb)", style=discord.ButtonStyle.primary, custom_id="resize_high")
+    @requires('panel', "You do not have permission to use this.")
     async def resize_high(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if await self.check_permissions(interaction):
-            await self.ask_for_confirmation(interaction, "resize", PLANS["high"])
+        await self.ask_for_confirmation(interaction, "resize", "high")
 
     @ui.button(label="Low Usage (2vcpu-8gb)", style=discord.ButtonStyle.primary, custom_id="resize_low")
+    @requires('panel', "You do not have permission to use this.")
     async def resize_low(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if await self.check_permissions(interaction):
-            await self.ask_for_confirmation(interaction, "resize", PLANS['low'])
+        await self.ask_for_confirmation(interaction, "resize", "low")
 
     @ui.button(label="Offline Mode", style=discord.ButtonStyle.danger, custom_id="resize_offline_mode")
+    @requires('panel', "You do not have permission to use this.")
     async def resize_offline_mode(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if await self.check_permissions(interaction):
-            await self.ask_for_confirmation(interaction, "resize", PLANS['off'])
+        await self.ask_for_confirmation(interaction, "resize", "off")
 
     @ui.button(label="Power On", style=discord.ButtonStyle.success, custom_id="poweron")
+    @requires('panel', "You do not have permission to use this.")
     async def power_on(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if await self.check_permissions(interaction):
-            await self.ask_for_confirmation(interaction, "power_on")
+        await self.ask_for_confirmation(interaction, "power_on")
 
     @ui.button(label="Power Off", style=discord.ButtonStyle.danger, custom_id="poweroff")
+    @requires('panel', "You do not have permission to use this.")
     async def power_off(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if await self.check_permissions(interaction):
-            await self.ask_for_confirmation(interaction, "power_off")
+        await self.ask_for_confirmation(interaction, "power_off")
 
     @ui.button(label="Reboot", style=discord.ButtonStyle.secondary, custom_id="reboot")
+    @requires('panel', "You do not have permission to use this.")
     async def reboot(self, interaction: discord.Interaction, button: discord.ui.Button):
-        if await self.check_permissions(interaction):
-            await self.ask_for_confirmation(interaction, "reboot")
+        await self.ask_for_confirmation(interaction, "reboot")
+
+    @ui.select(placeholder="🎯 Target droplet", custom_id="target_droplet", row=2)
+    @requires('panel', "You do not have permission to use this.")
+    async def select_target(self, interaction: discord.Interaction, select: discord.ui.Select):
+        tenant = tenant_for(interaction)
+        if not find_droplets(select.values[0], tenant):
+            await interaction.response.send_message("❌ That droplet is not managed from this server.", ephemeral=True)
+            return
+        self.targets[(interaction.guild_id, interaction.user.id)] = select.values[0]
+        names = ", ".join(droplet.name for droplet in find_droplets(select.values[0], tenant))
+        await interaction.response.send_message(f"Now targeting: {names} 🎯", ephemeral=True)
 
 # --- Embed ---
-async def create_embed(ctx_or_interaction):
-    """Creates and sends the main droplet management embed."""
-    global current_plan
+def action_progress(droplet):
+    """In-flight action with elapsed time, e.g. 'resize to s-4vcpu-16gb-amd (3m 10s, usually ~6m)', or None."""
+    busy_with = action_coordinator.in_flight(droplet)
+    if busy_with is None:
+        return None
+    entry = action_tracker.latest.get(droplet.id)
+    if entry is None or entry['status'] != 'in-progress':
+        return busy_with
+    minutes, seconds = divmod(int(time.monotonic() - entry['started_at']), 60)
+    typical = f", usually ~{forecaster.lead_time / 60:.0f}m" if entry['type'] == 'resize' else ""
+    return f"{busy_with} ({minutes}m {seconds:02d}s{typical})"
+
+def next_change(droplet):
+    """The soonest scheduled job or schedule entry that will change the droplet, as text."""
+    jobs = [
+        job for job in scheduler.pending()
+        if job['kind'] in ('resize', 'reboot') and tenant_of_job(job) is droplet.tenant
+        and droplet in find_droplets(job['args'].get('droplet'), droplet.tenant)
+    ]
+    change = droplet.next_schedule_change()
+    if jobs and (change is None or jobs[0]['run_at'] < change[0].timestamp()):
+        job = jobs[0]
+        what = f"resize to {job['args']['plan']}" if job['kind'] == 'resize' else "reboot"
+        return f"{what} <t:{int(job['run_at'])}:R> (job {job['id']})"
+    if change is not None:
+        at, tier = change
+        return f"schedule → {tier} at {at:%H:%M} (<t:{int(at.timestamp())}:R>)"
+    return None
+
+def render_dashboard(tenant=None):
+    """Builds a tenant's management embed from cached state only; nothing here calls an API."""
+    tenant = tenant or default_tenant
     embed = discord.Embed(
         title="🔧 FoundationX Droplet Management",
         description="Easily manage the FX DigitalOcean droplet using the functions below.",
         color=discord.Color.blue()
     )
-    current_plan = get_size_slug()  # Update the current plan
     embed.add_field(name="🔄 Resize", value="Use buttons to resize the droplet.", inline=False)
     embed.add_field(name="⚡ Power", value="Power on/off the droplet or reboot it.", inline=False)
-    embed.add_field(name="📈 Current Plan: \n", value=f"{current_plan}", inline=False)
+    if len(tenant.fleet) > 1:
+        embed.add_field(name="🎯 Target", value="Pick a droplet or the whole fleet from the menu first.", inline=False)
+    for droplet in list(tenant.fleet.values())[:20]:
+        state = droplet.state
+        lines = [f"Plan: {state.size_slug}", state.describe(), f"👥 Players: {droplet.players.total}"]
+        latency = [health_prober.stats_for(droplet, kind) for kind in ('tcp', 'ping') if kind in health_prober.kinds(droplet)]
+        if latency and latency[0].results:
+            lines.append(f"📶 {latency[0].summary()}")
+        now = droplet.local_time()
+        forecast = forecaster.predict(droplet, now, now + timedelta(hours=1))
+        if forecast is not None:
+            tier = autoscaler.required_tier(droplet, forecast)
+            lines.append(f"🔮 Next hour: up to {forecast:.0f} players ({tier} plan)")
+        progress = action_progress(droplet)
+        if progress is not None:
+            lines.append(f"⏳ In progress: {progress}")
+        upcoming = next_change(droplet)
+        if upcoming is not None:
+            lines.append(f"🗓️ Next: {upcoming}")
+        embed.add_field(name=f"📈 {droplet.name}", value="\n".join(lines)[:1024], inline=False)
+    now = time.time()
+    droplets = list(tenant.fleet.values())
+    actual, baseline, _ = cost_engine.fleet_spend(now - 30 * 86400, now, droplets)
+    embed.add_field(
+        name="💰 Spend (30 days)",
+        value=f"${actual:.2f} (${baseline - actual:.2f} saved vs always {BASELINE_PLAN}) • projected ${cost_engine.projected_monthly(droplets=droplets):.2f}/month",
+        inline=False
+    )
     embed.set_footer(text="Created by EthanSpleefan.")
+    return embed
 
-    view = DropletManagementView()
+async def create_embed(ctx_or_interaction):
+    """Creates and sends the main droplet management embed."""
+    tenant = tenant_for(ctx_or_interaction)
+    await asyncio.gather(*(droplet.state.get() for droplet in tenant.fleet.values()))
+    embed = render_dashboard(tenant)
+    view = tenant.view
 
     if isinstance(ctx_or_interaction, discord.Interaction):
         await ctx_or_interaction.response.send_message(embed=embed, view=view)
     else:
         await ctx_or_interaction.send(embed=embed, view=view)
 
-# --- Server Monitoring and Auto-Resizing ---
-'''@tasks.loop(seconds=100)
-async def ddos_check():
-    global SERVER_IP
+class LiveDashboard:
+    """A tenant's management message, edited in place whenever what it shows changes."""
+
+    def __init__(self, tenant):
+        self.tenant = tenant
+        self.rendered = None  # Embed dict of the last edit, without its timestamp
+        self.lock = asyncio.Lock()
+
+    @property
+    def location(self):
+        """(channel ID, message ID) of the dashboard message, or None."""
+        dashboard = self.tenant.settings.get('dashboard') or {}
+        if dashboard.get('channel_id') and dashboard.get('message_id'):
+            return dashboard['channel_id'], dashboard['message_id']
+        return None
+
+    async def post(self, channel):
+        """Posts a fresh dashboard message in a channel and makes it the one kept up to date."""
+        async with self.lock:
+            previous = self.location
+            embed = render_dashboard(self.tenant)
+            self.rendered = embed.to_dict()
+            embed.timestamp = discord.utils.utcnow()
+            message = await channel.send(embed=embed, view=self.tenant.view)
+            self.tenant.update_settings(dashboard={'channel_id': channel.id, 'message_id': message.id})
+        if previous is not None:
+            with contextlib.suppress(discord.HTTPException):
+                await bot.get_partial_messageable(previous[0]).get_partial_message(previous[1]).delete()
+        return message
+
+    async def refresh(self):
+        """Edits the dashboard message if the rendered embed differs from the last edit."""
+        location = self.location
+        if location is None:
+            return False
+        async with self.lock:
+            embed = render_dashboard(self.tenant)
+            rendered = embed.to_dict()
+            if rendered == self.rendered:
+                return False
+            embed.timestamp = discord.utils.utcnow()
+            message = bot.get_partial_messageable(location[0]).get_partial_message(location[1])
+            try:
+                await message.edit(embed=embed, view=self.tenant.view)
+            except discord.NotFound:
+                logging.warning(f"Dashboard message for {self.tenant.name} was deleted; use /dashboard to post a new one")
+                self.tenant.update_settings(dashboard=None)
+                return False
+            except discord.HTTPException as e:
+                logging.error(f"Error updating the dashboard: {e}")
+                return False
+            self.rendered = rendered
+            return True
+
+for tenant in tenants.values():
+    tenant.dashboard = LiveDashboard(tenant)
+
+@tasks.loop(seconds=DASHBOARD_INTERVAL)
+async def update_dashboard():
+    """Keeps every tenant's live dashboard current; the interval doubles as the edit throttle."""
+    live = [tenant.dashboard for tenant in tenants.values() if tenant.dashboard.location is not None]
+    await asyncio.gather(*(droplet.state.get() for dashboard in live for droplet in dashboard.tenant.fleet.values()))  # Usually a 304 or a cache hit
+    await asyncio.gather(*(dashboard.refresh() for dashboard in live))
 
-    delay = ping3.ping(SERVER_IP)
-    if delay is None or delay <'''
+# --- Server Monitoring and Auto-Resizing ---
+# --- Health Probes ---
+class ProbeStats:
+    """Rolling latency percentiles and packet loss for one probe target."""
+
+    def __init__(self, window=PROBE_WINDOW):
+        self.results = deque(maxlen=window)  # Latency in ms, or None for a lost probe
+        self.consecutive_failures = 0
+
+    def add(self, latency_ms):
+        self.results.append(latency_ms)
+        self.consecutive_failures = self.consecutive_failures + 1 if latency_ms is None else 0
+
+    @property
+    def last(self):
+        return self.results[-1] if self.results else None
+
+    @property
+    def loss(self):
+        """Fraction of probes in the window that were lost."""
+        return sum(result is None for result in self.results) / len(self.results) if self.results else 0.0
+
+    def percentile(self, p):
+        """Nearest-rank percentile of successful probe latencies, or None if none succeeded."""
+        latencies = sorted(result for result in self.results if result is not None)
+        if not latencies:
+            return None
+        return latencies[max(0, -(-p * len(latencies) // 100) - 1)]
+
+    def summary(self):
+        p50, p95, p99 = (self.percentile(p) for p in (50, 95, 99))
+        if p50 is None:
+            return f"no replies • {self.loss:.0%} loss"
+        return f"p50 {p50:.0f} ms • p95 {p95:.0f} ms • p99 {p99:.0f} ms • {self.loss:.0%} loss"
+
+class HealthProber:
+    """Probes every droplet over ICMP, TCP and HTTP concurrently, with jitter and per-probe timeouts."""
+
+    def __init__(self, timeout=PROBE_TIMEOUT, jitter=PROBE_JITTER, threshold=UNRESPONSIVE_THRESHOLD):
+        self.timeout = timeout
+        self.jitter = jitter
+        self.threshold = threshold
+        self.stats = {}  # (droplet ID, probe kind) -> ProbeStats
+        self.unresponsive = set()  # Droplet IDs currently flagged as unresponsive
+
+    def stats_for(self, droplet, kind):
+        return self.stats.setdefault((droplet.id, kind), ProbeStats())
+
+    async def probe_ping(self, droplet):
+        import ping3  # Optional; only loaded once the first probe runs
+
+        # ping3 uses blocking sockets, so run it on a worker thread
+        delay = await asyncio.to_thread(ping3.ping, droplet.server_ip, timeout=self.timeout)
+        return delay * 1000 if delay else None
+
+    async def probe_tcp(self, droplet):
+        started = time.perf_counter()
+        _, writer = await asyncio.wait_for(asyncio.open_connection(droplet.server_ip, droplet.game_port), self.timeout)
+        latency = (time.perf_counter() - started) * 1000
+        writer.close()
+        return latency
+
+    async def probe_http(self, droplet):
+        session = await get_http_session()
+        started = time.perf_counter()
+        async with session.get(droplet.players.api_url + 'server-stats', params={'page': 0, 'perPage': 1},
+                               timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+            await response.read()
+            return (time.perf_counter() - started) * 1000 if response.status < 500 else None
+
+    def kinds(self, droplet):
+        kinds = {'ping': self.probe_ping, 'http': self.probe_http}
+        if droplet.game_port:
+            kinds['tcp'] = self.probe_tcp
+        return kinds
+
+    async def probe_droplet(self, droplet, jitter=True):
+        """Runs all probes for one droplet at once and records the results."""
+        if jitter and self.jitter:
+            await asyncio.sleep(random.uniform(0, self.jitter))
+        kinds = self.kinds(droplet)
+        results = await asyncio.gather(*(probe(droplet) for probe in kinds.values()), return_exceptions=True)
+        for kind, result in zip(kinds, results):
+            latency = result if isinstance(result, (int, float)) and not isinstance(result, bool) else None
+            self.stats_for(droplet, kind).add(latency)
+            metrics_store.record(f'{kind}_loss', droplet.id, 0 if latency is not None else 1)
+            if latency is not None:
+                metrics_store.record(f'{kind}_ms', droplet.id, latency)
+
+    def is_unresponsive(self, droplet):
+        """True once every reachability probe (ICMP, and TCP when configured) has failed several rounds in a row."""
+        kinds = [kind for kind in self.kinds(droplet) if kind != 'http']
+        return all(self.stats_for(droplet, kind).consecutive_failures >= self.threshold for kind in kinds)
+
+    async def run_once(self):
+        """Probes the whole fleet and reports droplets that stop or start responding."""
+        droplets = list(fleet.values())
+        await asyncio.gather(*(self.probe_droplet(droplet) for droplet in droplets))
+        for droplet in droplets:
+            down = self.is_unresponsive(droplet) and droplet.state.size_slug != droplet.plans['off']
+            if down and droplet.id not in self.unresponsive:
+                self.unresponsive.add(droplet.id)
+                metrics_store.record_event('unresponsive', droplet.id)
+                log_event("Server Unresponsive", f"{droplet.name} is not responding; possible DDoS attack.", color=discord.Color.red(), tenant=droplet.tenant)
+            elif not down and droplet.id in self.unresponsive:
+                self.unresponsive.discard(droplet.id)
+                metrics_store.record_event('recovered', droplet.id)
+                log_event("Server Responding", f"{droplet.name} is responding again.", color=discord.Color.green(), tenant=droplet.tenant)
+
+health_prober = HealthProber()
+
+@tasks.loop(seconds=PROBE_INTERVAL)
+async def run_health_probes():
+    """Runs a round of health probes in the background."""
+    await health_prober.run_once()
+
+monitoring = set()  # Droplet IDs with a resize check under way
 
 @tasks.loop(seconds=CHECK_INTERVAL)
 async def monitor_server():
-    """Monitors the server and automatically resizes based on player count and time."""
-    global current_plan, servers_not_resizing_count, disable_resizing, SERVER_IP
-
-    if disable_resizing:
+    """Evaluates every tenant's droplets concurrently, sharing the slots fairly, and resizes the ones that need it."""
+    groups = [list(tenant.fleet.values()) for tenant in tenants.values() if not tenant.disable_resizing]
+    if not groups:
         return
 
-    now = datetime.now(timezone(timedelta(hours=10)))  # Brisbane time
-    sydney_time = now + timedelta(hours=1)  # Convert Brisbane to Sydney time (AEDT)
-    current_hour, current_minute = sydney_time.hour, sydney_time.minute
-    active_players = await check_active_players()
-    channel = bot.get_channel(LOG_CHANNEL_ID)
+    started = time.perf_counter()
+    results = await run_fair(groups, monitor_droplet)
+    for droplet, result in results.items():
+        if isinstance(result, Exception):
+            logging.error(f"Monitoring {droplet.name} failed: {result!r}")
+    telemetry.observe('fxbot_monitor_tick_seconds', time.perf_counter() - started)
+
+async def monitor_droplet(droplet):
+    """Monitors one droplet and automatically resizes it based on player count and its schedule."""
+    if droplet.id in monitoring:  # /load_auto and the loop can overlap; one evaluation per droplet at a time
+        logging.info(f"Skipping resize check for {droplet.name}; already being checked.")
+        return
+    monitoring.add(droplet.id)
+    try:
+        await evaluate_droplet(droplet)
+    finally:
+        monitoring.discard(droplet.id)
+
+async def evaluate_droplet(droplet):
+    state = await droplet.state.get()
+    busy_with = action_coordinator.in_flight(droplet)
+    if busy_with is not None:
+        logging.info(f"Skipping resize check for {droplet.name}; {busy_with} still in progress.")
+        return
+    current_plan = state.size_slug
 
-    '''delay = ping3.ping(SERVER_IP)
-    channel = bot.get_channel(LOG_CHANNEL_ID)
+    local_time = droplet.local_time()
+    active_players = await check_active_players(droplet)
 
-    if delay is None and active_players not in (0, 1) and current_plan != PLANS['off']:
-        await send_embed(channel, "Server Unresponsive", "Server not responding; possible DDoS attack.", color=discord.Color.red())
+    if droplet.id in health_prober.unresponsive and active_players not in (0, 1):
+        logging.info(f"{droplet.name} is unresponsive; treating it as having no players.")
         active_players = 0  # Treat as no players if server is down
-    elif delay is not None and active_players not in (0, 1) and current_plan != PLANS["off"]:
-        logging.info("Server is responding")
-    else:
-        return'''
-
-    # Determine target plan based on time in Sydney
-    if (current_hour == 7 and current_minute >= 30) or (7 < current_hour < 14):
-        target_plan = PLANS['low']
-    elif (current_hour == 13 and current_minute >= 30) or (14 < current_hour < 16):
-        target_plan = PLANS['medium']
-    elif (current_hour == 16) or (16 < current_hour < 20):
-        target_plan = PLANS['high']
-    elif (current_hour == 20) or (20 < current_hour < 2):
-        target_plan = PLANS['medium']
+
+    # Size to the observed and forecast load; fall back to the schedule until there is any history
+    current_tier = droplet.tier_of(current_plan)
+    decision_started = time.monotonic()
+    decision = autoscaler.decide(droplet, current_tier, forecaster.horizon(droplet, local_time))
+    if decision is not None:
+        target_tier, reason = decision
+        target_plan = droplet.plans[target_tier]
     else:
-        target_plan = PLANS['low'] ## TEMP SET TO OFF WHEN FIXED ERROR ERROR - Failed to resize droplet: {"id":"unprocessable_entity","message":"This size is not available because it has a smaller disk."}
+        target_plan, reason = droplet.scheduled_plan(local_time), "schedule"
 
     if target_plan == current_plan:
-        logging.info(f"No resize needed; current plan ({current_plan}) matches target ({target_plan}).")
+        logging.info(f"No resize needed for {droplet.name}; current plan ({current_plan}) matches target ({target_plan}, {reason}).")
         return
 
-    if active_players in (0, 1):
-        await asyncio.sleep(120)
-        active_players = await check_active_players()
+    # Resizing reboots the server, so wait for it to empty unless it is already over capacity and the target is bigger
+    target_tier = droplet.tier_of(target_plan)
+    saturated = (
+        current_tier is not None and target_tier is not None
+        and active_players > droplet.capacity[current_tier]
+        and PLAN_ORDER.index(target_tier) > PLAN_ORDER.index(current_tier)
+    )
+    if saturated:
+        log_event("Scaling Up", f"{droplet.name} is over capacity ({active_players} players on {current_plan}); resizing to {target_plan} now ({reason}).", color=discord.Color.orange(), tenant=droplet.tenant)
+
+    if saturated or active_players in (0, 1):
+        if not saturated:
+            await asyncio.sleep(120)
+            active_players = await check_active_players(droplet)
 
-        if active_players in (0, 1):
+        if saturated or active_players in (0, 1):
             try:
-                resize_droplet(target_plan)
-                current_plan = target_plan
-                servers_not_resizing_count = 0
-                await send_embed(channel, "Server Resized", f"Server resized to: {target_plan} at {sydney_time}. Players: {active_players}.")
-
-                if target_plan != PLANS['off']:
-                    await asyncio.sleep(75)
-                    perform_droplet_action("reboot")
-                    await send_embed(channel, "Server Rebooted", f"Server rebooted after resizing to {target_plan} at {sydney_time}.")
-                else:
-                    await send_embed(channel, "Server Off", "Server resized to 'off' plan; will not reboot until the next day.")
-                    await bot.change_presence(status=discord.Status.dnd)
+                async with action_coordinator.operation(droplet, f"autoscale to {target_plan}") as claim:
+                    await submit_and_wait(droplet, 'resize', target_plan, claim)
+                    droplet.servers_not_resizing_count = 0
+                    metrics_store.record_event('resize', droplet.id, plan=target_plan, previous=current_plan, status='completed', reason=reason, players=active_players)
+                    log_event("Server Resized", f"{droplet.name} resized to: {target_plan} at {local_time} ({reason}). Players: {active_players}.", tenant=droplet.tenant)
+
+                    if target_plan != droplet.plans['off']:
+                        await submit_and_wait(droplet, 'reboot', claim=claim)
+                        forecaster.record_resize_duration(time.monotonic() - decision_started)
+                        metrics_store.record('resize_seconds', droplet.id, time.monotonic() - decision_started)
+                        log_event("Server Rebooted", f"{droplet.name} rebooted after resizing to {target_plan} at {local_time}.", tenant=droplet.tenant)
+                    else:
+                        log_event("Server Off", f"{droplet.name} resized to 'off' plan; will not reboot until the next day.", tenant=droplet.tenant)
+                        if len(fleet) == 1:
+                            await bot.change_presence(status=discord.Status.dnd)
+            except ActionConflict as e:
+                logging.info(f"Autoscaler skipped {droplet.name}: {e}")
             except Exception as e:
-                await send_embed(channel, "Resize Error", f"Error resizing the server: {str(e)}", color=discord.Color.red())
+                metrics_store.record_event('resize', droplet.id, plan=target_plan, previous=current_plan, status='error', reason=reason, error=str(e))
+                log_event("Resize Error", f"Error resizing {droplet.name}: {str(e)}", color=discord.Color.red(), tenant=droplet.tenant)
         else:
-            await send_embed(channel, "Resize Skipped", f"No resize needed. Players: {active_players} at {sydney_time}.")
+            log_event("Resize Skipped", f"No resize needed for {droplet.name}. Players: {active_players} at {local_time}.", priority=LOG_QUIET, tenant=droplet.tenant)
     else:
-        if servers_not_resizing_count == 0:
-            servers_not_resizing_count += 1
-            await send_embed(channel, "No Resize", f"No resizing required. Players: {active_players} at {sydney_time}.")
+        if droplet.servers_not_resizing_count == 0:
+            droplet.servers_not_resizing_count += 1
+            log_event("No Resize", f"No resizing required for {droplet.name}. Players: {active_players} at {local_time}.", priority=LOG_QUIET, tenant=droplet.tenant)
+
+# --- Job Scheduler ---
+class JobScheduler:
+    """Persistent min-heap of one-off and recurring jobs, driven by a single wakeup timer.
+
+    A single replica keeps the jobs in a file. Replicas sharing a coordination backend keep them there instead,
+    so every replica sees every job and a new leader picks them up after a failover.
+    """
+
+    def __init__(self, path=JOBS_FILE):
+        self.path = path
+        self.store = None  # Coordination backend holding the jobs; None keeps them in the jobs file
+        self.jobs = {}  # Job ID -> {'id', 'kind', 'run_at', 'interval', 'args', 'description'}
+        self.heap = []  # (run_at, job ID); entries for cancelled or rescheduled jobs are skipped lazily
+        self.handlers = {}  # Job kind -> coroutine function taking the job
+        self.changes = {}  # Job ID -> job, or None once removed; not yet merged into the stored jobs
+        self.active = False  # Only the leader runs jobs; followers just keep the list current
+        self.revision = None  # Of the stored jobs when we last read or wrote them
+        self._timer = None
+        self._save_pending = False
+        self._save_lock = asyncio.Lock()
+        self._running = set()
+
+    def handler(self, kind):
+        """Decorator registering the coroutine that runs jobs of a kind."""
+        def register(func):
+            self.handlers[kind] = func
+            return func
+        return register
+
+    async def load(self):
+        """Loads persisted jobs; overdue ones run as soon as the scheduler starts."""
+        try:
+            self.revision, jobs = await self._read()
+        except Exception as e:  # The backend may be down; check() loads the jobs once it is back
+            logging.error(f"Failed to load scheduled jobs: {e!r}")
+            return
+        self._replace(jobs)
+        if self.store is not None and self.revision is None and os.path.exists(self.path):
+            # First start with a shared backend: carry over the jobs this replica kept in its file
+            for job_id, job in self._read_file().items():
+                self.jobs[job_id] = self.changes[job_id] = job
+                heapq.heappush(self.heap, (job['run_at'], job_id))
+            self._changed()
+        update_schedule_flags()
+
+    async def _read(self):
+        """The stored jobs and their revision: a counter in the backend, or the file's modification time."""
+        if self.store is not None:
+            document = await self.store.get('jobs') or {}
+            return document.get('revision'), {job['id']: job for job in document.get('jobs', [])}
+        if not os.path.exists(self.path):
+            return None, {}
+        return os.stat(self.path).st_mtime_ns, self._read_file()
+
+    def _read_file(self):
+        try:
+            return {job['id']: job for job in load_json(self.path).get('jobs', [])}
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:  # Left empty or truncated by a crash mid-write; better to lose the jobs than not start
+            logging.error(f"Ignoring unreadable {self.path}: {e}")
+            return {}
+
+    async def _write(self, jobs, revision):
+        """Stores the jobs and returns their new revision."""
+        if self.store is not None:
+            await self.store.put('jobs', {'revision': (revision or 0) + 1, 'jobs': list(jobs.values())})
+            return (revision or 0) + 1
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'jobs': list(jobs.values())}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        return os.stat(self.path).st_mtime_ns
+
+    @contextlib.asynccontextmanager
+    async def _locked(self):
+        """Holds the backend's jobs lease, so replicas merging changes at once never drop each other's jobs."""
+        if self.store is None:
+            yield  # One replica; nobody else writes the file
+            return
+        while not await self.store.acquire('jobs-lock', leader_election.node_id, 10):
+            await asyncio.sleep(0.1)
+        try:
+            yield
+        finally:
+            await self.store.release('jobs-lock', leader_election.node_id)
+
+    def _replace(self, jobs):
+        self.jobs = jobs
+        self.heap = [(job['run_at'], job['id']) for job in jobs.values()]
+        heapq.heapify(self.heap)
+
+    async def check(self):
+        """Reloads the jobs if another replica changed them. Returns True if it did."""
+        if self.changes and not self._save_pending and not self._save_lock.locked():
+            await self.save()  # An earlier save failed; store our changes before looking at anyone else's
+        if self._save_pending or self._save_lock.locked():
+            return False
+        revision, jobs = await self._read()
+        if revision == self.revision or self._save_pending or self._save_lock.locked():
+            return False
+        self.revision = revision
+        self._replace(jobs)
+        update_schedule_flags()
+        self._arm()
+        return True
+
+    async def save(self):
+        """Merges our changes into the stored jobs under a lock, then adopts what other replicas stored."""
+        async with self._save_lock:
+            self._save_pending = False
+            if not self.changes:
+                return
+            try:
+                async with self._locked():
+                    revision, jobs = await self._read()
+                    changes, self.changes = self.changes, {}
+                    for job_id, job in changes.items():
+                        if job is None:
+                            jobs.pop(job_id, None)
+                        else:
+                            jobs[job_id] = job
+                    try:
+                        self.revision = await self._write(jobs, revision)
+                    except BaseException:
+                        self.changes = {**changes, **self.changes}
+                        raise
+            except Exception as e:
+                # Kept for the next save; until then only this replica knows about them
+                logging.error(f"Failed to save scheduled jobs: {e!r}")
+                return
+            for job_id, job in self.changes.items():  # Made while we were writing; the next save stores them
+                if job is None:
+                    jobs.pop(job_id, None)
+                else:
+                    jobs[job_id] = job
+            self._replace(jobs)
+        update_schedule_flags()
+        self._arm()
+
+    def add(self, kind, run_at, interval=None, description='', **args):
+        """Schedules a job at a UNIX time, repeating every `interval` seconds if given. Returns its ID."""
+        job_id = uuid.uuid4().hex[:8]  # Random, so replicas adding jobs at the same time never collide
+        self.jobs[job_id] = {'id': job_id, 'kind': kind, 'run_at': run_at, 'interval': interval, 'args': args, 'description': description}
+        self.changes[job_id] = self.jobs[job_id]
+        heapq.heappush(self.heap, (run_at, job_id))
+        self._changed()
+        return job_id
+
+    def cancel(self, job_id):
+        """Cancels a pending job. Returns False if there is no such job."""
+        if self.jobs.pop(job_id, None) is None:
+            return False
+        self.changes[job_id] = None
+        self._changed()
+        return True
+
+    def pending(self, kind=None):
+        """Pending jobs, soonest first, optionally of one kind."""
+        return sorted((job for job in self.jobs.values() if kind is None or job['kind'] == kind), key=lambda job: job['run_at'])
+
+    def _changed(self):
+        # Coalesce the writes from a burst of changes in one loop iteration into a single save
+        if not self._save_pending:
+            self._save_pending = True
+            asyncio.get_running_loop().call_soon(lambda: asyncio.ensure_future(self.save()))
+        update_schedule_flags()
+        self._arm()
+
+    def start(self):
+        """Arms the wakeup timer; call once the event loop is running."""
+        self.active = True
+        self._arm()
+
+    def stop(self):
+        """Stops running jobs here; jobs already under way finish."""
+        self.active = False
+        self._arm()
+
+    def _arm(self):
+        """Points the single wakeup timer at the soonest live job."""
+        while self.heap and (self.heap[0][1] not in self.jobs or self.jobs[self.heap[0][1]]['run_at'] != self.heap[0][0]):
+            heapq.heappop(self.heap)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.heap and self.active:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return  # Not running yet; start() arms the timer
+            delay = max(0.0, self.heap[0][0] - time.time())
+            self._timer = loop.call_later(delay, self._run_due)
+
+    def _run_due(self):
+        self._timer = None
+        now = time.time()
+        while self.heap and self.heap[0][0] <= now:
+            run_at, job_id = heapq.heappop(self.heap)
+            job = self.jobs.get(job_id)
+            if job is None or job['run_at'] != run_at:
+                continue
+            if job['interval']:
+                # Missed occurrences (e.g. while the bot was down) run once, then the job moves to its next future slot
+                while job['run_at'] <= now:
+                    job['run_at'] = self._next_run(job)
+                heapq.heappush(self.heap, (job['run_at'], job_id))
+                self.changes[job_id] = job
+            else:
+                del self.jobs[job_id]
+                self.changes[job_id] = None
+            task = asyncio.create_task(self._execute(dict(job)))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+        self._changed()
+
+    @staticmethod
+    def _next_run(job):
+        """The occurrence after job['run_at']; daily jobs keep their local wall-clock time across DST changes."""
+        at, tz = job['args'].get('at'), job['args'].get('tz')
+        if at is None or tz is None:
+            return job['run_at'] + job['interval']
+        return max(next_local_time(at, tz), job['run_at'] + 1)
+
+    async def _execute(self, job):
+        handler = self.handlers.get(job['kind'])
+        if handler is None:
+            logging.error(f"No handler for scheduled job {job['id']} ({job['kind']})")
+            return
+        if tenant_of_job(job) is None:  # Its droplets default to the main fleet, so never run it there
+            logging.warning(f"Skipping scheduled job {job['id']} ({job['kind']}); guild {job['args']['guild']} is no longer served")
+            return
+        try:
+            await handler(job)
+        except Exception as e:
+            logging.error(f"Scheduled job {job['id']} ({job['kind']}) failed: {e!r}")
+            log_event("Scheduled Job Failed", f"{job['description'] or job['kind']}: {str(e)}", color=discord.Color.red(), tenant=tenant_of_job(job))
+
+scheduler = JobScheduler()
+
+def update_schedule_flags():
+    """Keeps the flags that mirror pending jobs in step with the scheduler."""
+    global reboot_scheduled
+    reboot_scheduled = bool(scheduler.pending('reboot'))
+    # Paused exactly while a re-enable job is pending, so restarts and other replicas' changes carry over
+    paused = {tenant_of_job(job) for job in scheduler.pending('enable_auto')}
+    for tenant in tenants.values():
+        tenant.disable_resizing = tenant in paused
+
+def next_local_time(hhmm, tz=TIMEZONE):
+    """UNIX time of the next occurrence of a local 'HH:MM'."""
+    zone = pytz.timezone(tz)
+    now = datetime.now(zone)
+    hour, minute = parse_hhmm(hhmm)
+    candidate = zone.localize(datetime(now.year, now.month, now.day, hour, minute))
+    if candidate <= now:
+        next_day = now.date() + timedelta(days=1)
+        candidate = zone.localize(datetime(next_day.year, next_day.month, next_day.day, hour, minute))
+    return candidate.timestamp()
+
+@scheduler.handler('enable_auto')
+async def run_enable_auto(job):
+    tenant = tenant_of_job(job)
+    tenant.disable_resizing = False
+    log_event("Auto Resizing Enabled", "Server resizing has been re-enabled.", tenant=tenant)
+
+@scheduler.handler('resize')
+async def run_scheduled_resize(job):
+    async def resize(droplet):
+        # Same sequence as the autoscaler: a resized droplet stays powered off until it is rebooted
+        size = droplet.plans[job['args']['plan']]
+        async with action_coordinator.operation(droplet, f"scheduled resize to {size}") as claim:
+            await submit_and_wait(droplet, 'resize', size, claim)
+            log_event("Scheduled Resize", f"{droplet.name} resized to {size} (job {job['id']}).", tenant=droplet.tenant)
+            if size != droplet.plans['off']:
+                await submit_and_wait(droplet, 'reboot', claim=claim)
+                log_event("Server Rebooted", f"{droplet.name} rebooted after its scheduled resize to {size}.", tenant=droplet.tenant)
+
+    droplets = find_droplets(job['args'].get('droplet'), tenant_of_job(job))
+    errors = [result for result in await run_bounded(droplets, resize) if isinstance(result, Exception)]
+    if errors:
+        raise errors[0]
+
+@scheduler.handler('reboot')
+async def run_scheduled_reboot(job):
+    for droplet in find_droplets(job['args'].get('droplet'), tenant_of_job(job)):
+        action_id, _ = await action_coordinator.submit(droplet, 'reboot')
+        if action_id is None:
+            raise RuntimeError(f"DigitalOcean rejected the scheduled reboot of {droplet.name}")
+        log_event("Scheduled Reboot", f"{droplet.name} is rebooting (job {job['id']}).", tenant=droplet.tenant)
+
+# --- Coordination ---
+def try_lock_file(handle):
+    """Takes a non-blocking exclusive lock on an open file. Returns False if another process holds it."""
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+class LocalCoordinator:
+    """Single-replica backend: this process always leads and shared state stays in memory."""
+
+    def __init__(self):
+        self.values = {}
+
+    async def acquire(self, name, holder, ttl):
+        return True
+
+    async def release(self, name, holder):
+        pass
+
+    async def put(self, key, value):
+        self.values[key] = value
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def close(self):
+        pass
+
+class FileCoordinator:
+    """Replicas on one host: the leader holds an OS lock on a file and shared state is written to JSON files beside it.
+
+    The OS drops the lock the moment its holder exits, so a follower takes over on its next attempt.
+    """
+
+    def __init__(self, path):
+        self.path = path  # Prefix for the lock and state files
+        self.handles = {}  # Lease name -> open lock file while we hold it
+
+    async def acquire(self, name, holder, ttl):
+        if name in self.handles:
+            return True
+        handle = open(f'{self.path}-{name}.lock', 'a+')
+        if not try_lock_file(handle):
+            handle.close()
+            return False
+        self.handles[name] = handle
+        return True
+
+    async def release(self, name, holder):
+        handle = self.handles.pop(name, None)
+        if handle is not None:
+            handle.close()  # Closing the file drops the lock
+
+    def _write(self, key, document):
+        temp_path = f'{self.path}-{key}.json.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(document)
+            f.flush()
+            os.fsync(f.fileno())  # Scheduled jobs live here too, so survive a crash
+        os.replace(temp_path, f'{self.path}-{key}.json')
+
+    def _read(self, key):
+        try:
+            return load_json(f'{self.path}-{key}.json')
+        except FileNotFoundError:
+            return None
+
+    async def put(self, key, value):
+        await asyncio.to_thread(self._write, key, json.dumps(value))
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._read, key)
+
+    async def close(self):
+        for name in list(self.handles):
+            await self.release(name, None)
+
+class SQLiteCoordinator:
+    """Replicas on one host: leases with expiry times and shared state in a SQLite (WAL) file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._db_lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT, expires REAL);
+                CREATE TABLE IF NOT EXISTS shared (key TEXT PRIMARY KEY, value TEXT);
+            """)
+        return self._conn
+
+    def _execute(self, sql, params=()):
+        with self._db_lock:
+            conn = self._connect()
+            with conn:
+                return conn.execute(sql, params).fetchall()
+
+    def _acquire(self, name, holder, ttl):
+        now = time.time()
+        with self._db_lock:
+            conn = self._connect()
+            with conn:
+                # Take the lease if it is free or expired, or extend it if it is already ours
+                conn.execute(
+                    'INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires = excluded.expires '
+                    'WHERE leases.holder = excluded.holder OR leases.expires < ?',
+                    (name, holder, now + ttl, now)
+                )
+                row = conn.execute('SELECT holder FROM leases WHERE name = ?', (name,)).fetchone()
+        return row is not None and row[0] == holder
+
+    async def acquire(self, name, holder, ttl):
+        return await asyncio.to_thread(self._acquire, name, holder, ttl)
+
+    async def release(self, name, holder):
+        await asyncio.to_thread(self._execute, 'DELETE FROM leases WHERE name = ? AND holder = ?', (name, holder))
+
+    async def put(self, key, value):
+        await asyncio.to_thread(self._execute, 'INSERT OR REPLACE INTO shared VALUES (?, ?)', (key, json.dumps(value)))
+
+    async def get(self, key):
+        rows = await asyncio.to_thread(self._execute, 'SELECT value FROM shared WHERE key = ?', (key,))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def close(self):
+        with self._db_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class RedisCoordinator:
+    """Replicas on several hosts: leases and shared state in Redis or anything speaking its protocol."""
+
+    RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0"
+    RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, url, prefix='fxbot:'):
+        import redis.asyncio as redis  # Optional; only needed for this backend
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    async def acquire(self, name, holder, ttl):
+        key, milliseconds = self.prefix + name, int(ttl * 1000)
+        if await self.redis.set(key, holder, nx=True, px=milliseconds):
+            return True
+        return bool(await self.redis.eval(self.RENEW, 1, key, holder, milliseconds))
+
+    async def release(self, name, holder):
+        await self.redis.eval(self.RELEASE, 1, self.prefix + name, holder)
+
+    async def put(self, key, value):
+        await self.redis.set(self.prefix + key, json.dumps(value))
+
+    async def get(self, key):
+        value = await self.redis.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    async def close(self):
+        await self.redis.aclose()
+
+def make_coordinator(settings):
+    """Builds the coordination backend named in the config's `coordination` section."""
+    backend = settings.get('backend', 'none')
+    if backend == 'none':
+        return LocalCoordinator()
+    if backend == 'file':
+        return FileCoordinator(settings.get('path', 'coordination'))
+    if backend == 'sqlite':
+        return SQLiteCoordinator(settings.get('path', 'coordination.db'))
+    if backend == 'redis':
+        return RedisCoordinator(settings['url'], settings.get('prefix', 'fxbot:'))
+    raise ValueError(f"Unknown coordination backend: {backend}")
+
+class LeaderElection:
+    """Holds a renewable lease so that exactly one replica runs the autoscaler, probes, dashboards and scheduled jobs."""
+
+    def __init__(self, coordinator, name='leader', ttl=LEASE_SECONDS):
+        self.coordinator = coordinator
+        self.name = name
+        self.ttl = ttl
+        self.node_id = COORDINATION.get('node_id') or f"{platform.node()}-{os.getpid()}"
+        self.is_leader = False
+
+    async def step(self):
+        """Takes or renews the lease. Returns whether this replica now leads."""
+        try:
+            leading = await self.coordinator.acquire(self.name, self.node_id, self.ttl)
+        except Exception as e:
+            # Without the backend we cannot know whether someone else holds the lease, so stand down
+            logging.error(f"Coordination backend unavailable: {e!r}")
+            leading = False
+        if leading != self.is_leader:
+            self.is_leader = leading
+            logging.info(f"{self.node_id} is now {'the leader' if leading else 'a follower'}")
+            telemetry.inc('fxbot_leadership_changes_total', role='leader' if leading else 'follower')
+        return leading
+
+    async def resign(self):
+        """Gives up the lease so a follower can take over without waiting for it to expire."""
+        if not self.is_leader:
+            return
+        self.is_leader = False
+        with contextlib.suppress(Exception):
+            await self.coordinator.release(self.name, self.node_id)
+
+coordinator = make_coordinator(COORDINATION)
+leader_election = LeaderElection(coordinator)
+if not isinstance(coordinator, LocalCoordinator):
+    if SHARD_COUNT and not SHARD_IDS:  # Every replica would connect every shard and answer every interaction
+        raise ValueError("Set shard_ids on each replica when shard_count and a coordination backend are set")
+    scheduler.store = action_coordinator.store = coordinator
+LEADER_LOOPS = (poll_players, run_health_probes, update_dashboard, monitor_server)  # Run on the leader only
+
+def handles_events():
+    """Whether this replica should answer Discord events.
+
+    Sharded replicas only receive their own guilds' events. Unsharded ones all receive every event,
+    so only the leader answers.
+    """
+    return bool(SHARD_COUNT) or isinstance(coordinator, LocalCoordinator) or leader_election.is_leader
+
+def apply_leadership(leading):
+    """Starts the leader-only work on this replica, or lets it wind down after the current pass."""
+    for loop in LEADER_LOOPS:
+        if leading and not loop.is_running():
+            loop.start()
+        elif not leading and loop.is_running():
+            loop.stop()  # Unlike cancel(), lets a resize under way finish
+    if leading and not scheduler.active:
+        scheduler.start()
+    elif not leading and scheduler.active:
+        scheduler.stop()
+
+def shared_snapshot():
+    """Cached droplet and player state as plain data with wall-clock timestamps."""
+    return {
+        'droplets': {droplet.id: droplet.state.snapshot() for droplet in fleet.values() if droplet.state.fetched_at is not None},
+        'players': {url: source.snapshot() for url, source in player_sources.items() if source.updated_at is not None},
+    }
+
+def absorb_snapshot(snapshot):
+    """Loads the leader's cached state into this replica's caches, so followers answer without calling the APIs."""
+    for droplet_id, state in (snapshot or {}).get('droplets', {}).items():
+        if droplet_id in fleet:
+            fleet[droplet_id].state.absorb(state)
+    for url, players in (snapshot or {}).get('players', {}).items():
+        if url in player_sources:
+            player_sources[url].absorb(players)
+
+@tasks.loop(seconds=LEASE_SECONDS / 3)
+async def coordinate():
+    """Renews or contests the leader lease, then publishes or absorbs the shared state."""
+    try:
+        leading = await leader_election.step()
+        apply_leadership(leading)
+        await scheduler.check()  # Jobs added, cancelled or run on another replica
+        if leading:
+            await coordinator.put('snapshot', shared_snapshot())
+        else:
+            absorb_snapshot(await coordinator.get('snapshot'))
+    except Exception as e:
+        # Any error escaping would stop this loop for good, leaving the leader work running on a lease nobody renews
+        logging.error(f"Error coordinating with other replicas: {e!r}")
+        await leader_election.resign()
+        apply_leadership(False)
 
 # --- Bot Commands ---
 @bot.tree.command(name="restart", description="Restart the droplet (Admin/Manager only)")
-async def restart_server(interaction: discord.Interaction):
+@discord.app_commands.describe(droplet="Droplet name or ID, or * for the whole fleet (defaults to the main droplet)")
+@requires(
+    'restart',
+    "You do not have permission to use this command. "
+    "If you believe this is an error, please try again or contact a developer. "
+    "If you need to restart the server, please ask an admin, manager, or developer."
+)
+async def restart_server(interaction: discord.Interaction, droplet: str = None):
     """Restarts the server (requires appropriate permissions)."""
-    user_roles = [role.id for role in interaction.user.roles]
-    if (interaction.user.id in authorized_users or
-            any(role in droplet_perms for role in user_roles) or
-            any(role in restart_perms for role in user_roles)):
-        view = ConfirmationView("reboot")
-        await interaction.response.send_message("Are you sure you want to restart the server?", view=view)
-    else:
-        await interaction.response.send_message(
-            "You do not have permission to use this command. "
-            "If you believe this is an error, please try again or contact a developer. "
-            "If you need to restart the server, please ask an admin, manager, or developer.",
-            ephemeral=True  # Send the message only to the user
-        )
+    tenant = tenant_for(interaction)
+    droplets = find_droplets(droplet, tenant)
+    if not droplets:
+        await interaction.response.send_message(f"❌ Unknown droplet: {droplet}", ephemeral=True)
+        return
+    view = ConfirmationView("reboot", droplets=droplets)
+    target = "the server" if len(tenant.fleet) == 1 else ", ".join(d.name for d in droplets)
+    scheduled = reboot_scheduled and any(tenant_of_job(job) is tenant for job in scheduler.pending('reboot'))
+    pending = " A reboot is already scheduled; see /jobs." if scheduled else ""
+    await interaction.response.send_message(f"Are you sure you want to restart {target}?{pending}", view=view)
 
 @bot.tree.command(name="disable_auto", description="Temporarily disable auto-resizing (in hours)")
 async def toggle_disable_resizing(interaction: discord.Interaction, hours: int):
     """Disables auto-resizing for a specified number of hours."""
-    global disable_resizing
-    disable_resizing = True
-    channel = bot.get_channel(LOG_CHANNEL_ID)
-    await interaction.response.send_message(f"Auto-resizing has been disabled for {hours} hours. ⛔")
-    await send_embed(channel, "Auto Resizing Disabled", f"Server auto-resizing has been disabled for {hours} hours.", color=discord.Color.red())
-
-    await asyncio.sleep(hours * 3600)  # Wait for the specified duration
-
-    disable_resizing = False
-    await send_embed(channel, "Auto Resizing Enabled", f"Server resizing has been re-enabled.")
-    await interaction.followup.send(f"Auto-resizing has been re-enabled after {hours} hours. 🔄", ephemeral=True)
+    tenant = tenant_for(interaction)
+    tenant.disable_resizing = True
+    # The latest call wins: replace any earlier re-enable job rather than racing it
+    for job in scheduler.pending('enable_auto'):
+        if tenant_of_job(job) is tenant:
+            scheduler.cancel(job['id'])
+    job_id = scheduler.add('enable_auto', time.time() + hours * 3600, description=f"Re-enable auto-resizing after {hours} hours", guild=tenant.guild_id)
+    await interaction.response.send_message(f"Auto-resizing has been disabled for {hours} hours. ⛔ (job {job_id})")
+    log_event("Auto Resizing Disabled", f"Server auto-resizing has been disabled for {hours} hours.", color=discord.Color.red(), tenant=tenant)
 
 @bot.tree.command(name="enable_auto", description="Enable auto-resizing")
 async def cancel_disable_resizing(interaction: discord.Interaction):
     """Manually re-enables auto-resizing."""
-    global disable_resizing
-    channel = bot.get_channel(LOG_CHANNEL_ID)
-    if disable_resizing:
-        disable_resizing = False
-        await send_embed(channel, "Auto-resizing has been manually enabled again.", color=discord.Color.green())
+    tenant = tenant_for(interaction)
+    if tenant.disable_resizing:
+        for job in scheduler.pending('enable_auto'):
+            if tenant_of_job(job) is tenant:
+                scheduler.cancel(job['id'])
+        tenant.disable_resizing = False
+        log_event("Auto Resizing Enabled", "Auto-resizing has been manually enabled again.", color=discord.Color.green(), tenant=tenant)
         await interaction.response.send_message("Auto-resizing has been manually enabled again. ✅")
     else:
         await interaction.response.send_message("Auto-resizing is already enabled. ✅")
 
+PLAN_CHOICES = [discord.app_commands.Choice(name=tier, value=tier) for tier in PLAN_ORDER]
+
+@bot.tree.command(name="schedule_resize", description="Schedule a resize at a local time, optionally every day.")
+@discord.app_commands.describe(plan="Plan to resize to", at="Local time as HH:MM", daily="Repeat every day", droplet="Droplet name or ID, or * for the whole fleet")
+@discord.app_commands.choices(plan=PLAN_CHOICES)
+@requires('manage')
+async def schedule_resize(interaction: discord.Interaction, plan: str, at: str, daily: bool = False, droplet: str = None):
+    """Schedules a one-off or daily resize."""
+    tenant = tenant_for(interaction)
+    droplets = find_droplets(droplet, tenant)
+    if not droplets:
+        await interaction.response.send_message(f"❌ Unknown droplet: {droplet}", ephemeral=True)
+        return
+    try:
+        run_at = next_local_time(at, droplets[0].timezone.zone)
+    except ValueError:
+        await interaction.response.send_message("❌ Time must be HH:MM.", ephemeral=True)
+        return
+    names = ", ".join(d.name for d in droplets)
+    job_id = scheduler.add('resize', run_at, 86400 if daily else None, f"Resize {names} to {plan}",
+                           plan=plan, droplet=droplet, guild=tenant.guild_id, at=at, tz=droplets[0].timezone.zone)
+    await interaction.response.send_message(f"🗓️ Job {job_id}: resize {names} to {plan} at <t:{int(run_at)}:t>{' every day' if daily else ''}.")
+
+@bot.tree.command(name="schedule_reboot", description="Schedule a reboot at a local time, optionally every day.")
+@discord.app_commands.describe(at="Local time as HH:MM", daily="Repeat every day", droplet="Droplet name or ID, or * for the whole fleet")
+@requires('manage')
+async def schedule_reboot(interaction: discord.Interaction, at: str, daily: bool = False, droplet: str = None):
+    """Schedules a one-off or daily reboot."""
+    tenant = tenant_for(interaction)
+    droplets = find_droplets(droplet, tenant)
+    if not droplets:
+        await interaction.response.send_message(f"❌ Unknown droplet: {droplet}", ephemeral=True)
+        return
+    try:
+        run_at = next_local_time(at, droplets[0].timezone.zone)
+    except ValueError:
+        await interaction.response.send_message("❌ Time must be HH:MM.", ephemeral=True)
+        return
+    names = ", ".join(d.name for d in droplets)
+    job_id = scheduler.add('reboot', run_at, 86400 if daily else None, f"Reboot {names}",
+                           droplet=droplet, guild=tenant.guild_id, at=at, tz=droplets[0].timezone.zone)
+    await interaction.response.send_message(f"🗓️ Job {job_id}: reboot {names} at <t:{int(run_at)}:t>{' every day' if daily else ''}.")
+
+@bot.tree.command(name="jobs", description="List scheduled jobs.")
+async def list_jobs(interaction: discord.Interaction):
+    """Lists this server's pending scheduled jobs, soonest first."""
+    tenant = tenant_for(interaction)
+    jobs = [job for job in scheduler.pending() if tenant_of_job(job) is tenant]
+    if not jobs:
+        await interaction.response.send_message("No scheduled jobs. 🗓️")
+        return
+    lines = [f"`{job['id']}` <t:{int(job['run_at'])}:f> {job['description'] or job['kind']}{' (daily)' if job['interval'] == 86400 else ''}" for job in jobs[:25]]
+    if len(jobs) > 25:
+        lines.append(f"…and {len(jobs) - 25} more")
+    await interaction.response.send_message("\n".join(lines))
+
+@bot.tree.command(name="cancel_job", description="Cancel a scheduled job by ID.")
+@requires('manage')
+async def cancel_job(interaction: discord.Interaction, job_id: str):
+    """Cancels one of this server's pending scheduled jobs."""
+    job = scheduler.jobs.get(job_id)
+    if job is not None and tenant_of_job(job) is tenant_for(interaction) and scheduler.cancel(job_id):
+        await interaction.response.send_message(f"Job {job_id} cancelled. ✅")
+    else:
+        await interaction.response.send_message(f"❌ No pending job with ID {job_id}.", ephemeral=True)
+
 @bot.tree.command(name="load_auto", description="Load's the auto-resizing loop.")
 async def reload_auto_resizing(interaction: discord.Interaction):
     """Load the auto-resizing loop."""
-    await monitor_server()
+    if not leader_election.is_leader:  # The autoscaler runs on the leader; a pass here would second-guess it
+        await interaction.response.send_message("Auto-resizing runs on the leader replica, not this one. ⚠️", ephemeral=True)
+        return
+    asyncio.create_task(monitor_server())  # Droplets the loop is already checking are skipped
     await interaction.response.send_message("Auto-resizing loop has been reloaded. ✅")
 
 # --- Event Handlers ---
 @bot.event
 async def on_message(message):
     """Handles incoming messages."""
+    if not handles_events():
+        return  # Another replica answers this one, prefix commands included
     if message.content.lower() == CONFIRM_COMMAND:
         await message.delete()
         sent_message = await message.channel.send("Action confirmed! Performing the requested operation...")
@@ -426,17 +3174,64 @@ async def on_message(message):
         await sent_message.delete()
     await bot.process_commands(message)
 
+async def sync_commands():
+    """Syncs slash commands, skipping the API call when they are unchanged since the last sync."""
+    payload = json.dumps([command.to_dict(bot.tree) for command in bot.tree.get_commands()], sort_keys=True, default=str)
+    digest = hashlib.sha256(payload.encode()).hexdigest()
+    if os.path.exists(COMMAND_HASH_FILE):
+        with open(COMMAND_HASH_FILE) as f:
+            if f.read().strip() == digest:
+                print("Slash commands unchanged; skipped sync")
+                return
+    synced = await bot.tree.sync()
+    with open(COMMAND_HASH_FILE, 'w') as f:
+        f.write(digest)
+    print(f"Synced {len(synced)} commands")
+
+async def warm_caches():
+    """Fetches droplet state and player counts in the background once the bot is connected, then logs the startup report."""
+    with startup_phase("warm caches"):
+        await asyncio.gather(
+            *(droplet.state.refresh() for droplet in fleet.values()),
+            *(source.refresh() for source in player_sources.values()),
+        )
+    logging.info(f"Startup timings: {startup_report()}")
+
 @bot.event
 async def on_ready():
     """Handles the bot becoming ready."""
+    global bootstrapped, ready_after
     print(f'{bot.user} has connected to Discord!')
     await bot.change_presence(activity=discord.Activity(status=discord.Status.online, type=discord.ActivityType.watching, name="FX Backend"))
-    try:
-        synced = await bot.tree.sync()
-        print(f"Synced {len(synced)} commands")
-    except Exception as e:
-        print(f"Error syncing commands: {e}")
-    monitor_server.start()  # Start the server monitoring loop
+    if bootstrapped:  # on_ready fires again after reconnects; the loops are already running
+        return
+    bootstrapped = True
+    ready_after = time.perf_counter() - PROCESS_STARTED
+    startup_timings.append(("login and connect", time.perf_counter() - bot.connect_started))
+    with startup_phase("command sync"):
+        try:
+            await sync_commands()
+        except Exception as e:
+            print(f"Error syncing commands: {e}")
+    asyncio.create_task(warm_caches())
+    await telemetry.start()
+    for tenant in tenants.values():
+        tenant.log.start()
+    flush_metrics.start()
+    watch_config.start()
+    coordinate.start()  # Starts polling, probes, dashboards, jobs and the monitor once this replica leads
+
+@bot.event
+async def on_app_command_completion(interaction, command):
+    """Records how long each slash command took, from the user running it to the handler returning."""
+    telemetry.observe('fxbot_interaction_seconds', interaction_elapsed(interaction), kind='command', name=command.qualified_name, outcome='ok')
+
+@bot.tree.error
+async def on_app_command_error(interaction, error):
+    """Records failed slash commands, then logs them as the default handler would."""
+    name = interaction.command.qualified_name if interaction.command else 'unknown'
+    telemetry.observe('fxbot_interaction_seconds', interaction_elapsed(interaction), kind='command', name=name, outcome='error')
+    logging.error(f"Ignoring exception in command {name!r}", exc_info=error)
 
 # --- Additional Commands ---
 @bot.command(name='embed')
@@ -447,19 +3242,50 @@ async def embed_command(ctx):
 @bot.tree.command(name='players', description="Check the number of active players.")
 async def check_players(interaction: discord.Interaction):
     """Displays the number of active players."""
-    active_players = await check_active_players()
-    await interaction.response.send_message(f"Active players: {active_players}")
+    tenant = tenant_for(interaction)
+    active_players = await check_active_players(tenant=tenant)
+    message = f"Active players: {active_players}"
+    if len(tenant.fleet) > 1:
+        counts = [(droplet.name, await check_active_players(droplet)) for droplet in tenant.fleet.values()]
+        message += "\n" + "\n".join(f"• {name}: {count}" for name, count in counts)
+    elif len(tenant.primary.players.per_server) > 1:
+        breakdown = "\n".join(f"• {server}: {count}" for server, count in tenant.primary.players.per_server.items() if count)
+        if breakdown:
+            message += f"\n{breakdown}"
+    await interaction.response.send_message(message[:2000])
+
+@bot.tree.command(name='cost', description="Show droplet spend and savings from auto-resizing.")
+async def cost_report(interaction: discord.Interaction):
+    """Displays spend per day, week and month against an always-on baseline plan."""
+    now = time.time()
+    droplets = list(tenant_for(interaction).fleet.values())
+    embed = discord.Embed(title="💰 Droplet Costs", color=discord.Color.gold())
+    for label, seconds in (("Last 24 hours", 86400), ("Last 7 days", 7 * 86400), ("Last 30 days", 30 * 86400)):
+        actual, baseline, tracked = cost_engine.fleet_spend(now - seconds, now, droplets)
+        saved = f"{(baseline - actual) / baseline:.0%}" if baseline else "n/a"
+        embed.add_field(
+            name=label,
+            value=f"${actual:.2f} spent • ${baseline:.2f} if always {BASELINE_PLAN} • {saved} saved\n{tracked:.0f} plan-hours tracked",
+            inline=False
+        )
+    embed.add_field(name="📅 Projected Monthly", value=f"${cost_engine.projected_monthly(droplets=droplets):.2f}", inline=False)
+    daily = "\n".join(f"{day:%a %d %b}: ${actual:.2f} (vs ${baseline:.2f})" for day, actual, baseline in cost_engine.daily(droplets=droplets))
+    embed.add_field(name="📆 Daily", value=daily or "No data yet.", inline=False)
+    if len(droplets) > 1:
+        lines = []
+        for droplet in droplets:
+            actual, baseline, _ = cost_engine.spend(droplet, now - 30 * 86400, now)
+            lines.append(f"• {droplet.name}: ${actual:.2f} (vs ${baseline:.2f}) • ${cost_engine.projected_monthly(droplet):.2f}/month")
+        embed.add_field(name="🖥️ Per Droplet (30 days)", value="\n".join(lines)[:1024], inline=False)
+    await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="reload", description="Reload the configuration file.")
 async def reload_json(interaction: discord.Interaction):
     """Reloads the configuration file."""
-    global droplet_perms, authorized_users, restart_perms, current_plan
     try:
-        permissions = load_permissions()
-        droplet_perms = permissions.get('droplet_perms', [])
-        authorized_users = permissions.get('authorized_users', [])
-        restart_perms = permissions.get('restart_perms', [])
-        current_plan = get_size_slug()
+        await config_store.flush()  # Don't let a pending write clobber the file we are about to re-read
+        config_store.check(force=True)
+        await asyncio.gather(*(droplet.state.refresh(force=True) for droplet in tenant_for(interaction).fleet.values()))
         await interaction.response.send_message("Reloaded configs successfully! ✅")
     except Exception as e:
         logging.error(f"Error reloading configs: {e}")
@@ -471,41 +3297,93 @@ async def cmds(ctx):
     await ctx.send("Command list not yet implemented.")
 
 @bot.command(name='add_role')
+@requires('manage', "ERROR ❌: You are not authorized to access this function!")
 async def set_roles(ctx, *role_ids):
-    """Adds roles to the droplet_perms list."""
-    global droplet_perms
-    if any(role.id in droplet_perms for role in ctx.author.roles) or ctx.author.id in authorized_users:
-        new_roles = [int(role_id) for role_id in role_ids]
-        droplet_perms.extend(role for role in new_roles if role not in droplet_perms)
-        save_permissions()
-        await ctx.send("Authorized roles updated successfully ✅.")
-    else:
-        await ctx.send("ERROR ❌: You are not authorized to access this function!")
+    """Adds roles to this server's droplet_perms list."""
+    tenant = tenant_for(ctx)
+    droplet_perms = tenant.settings.get('droplet_perms', [])
+    new_roles = [int(role_id) for role_id in role_ids]
+    tenant.update_settings(droplet_perms=droplet_perms + [role for role in dict.fromkeys(new_roles) if role not in droplet_perms])
+    await ctx.send("Authorized roles updated successfully ✅.")
 
 @bot.tree.command(name='uptime', description="Check the bot's uptime.")
+@requires('manage')
 async def uptime(interaction: discord.Interaction):
     """Displays the bot's uptime."""
-    if (interaction.user.id in authorized_users or
-            any(role.id in droplet_perms for role in interaction.user.roles)):
-        uptime_seconds = int(psutil.time.time() - psutil.boot_time())
-        hours, remainder = divmod(uptime_seconds, 3600)
-        minutes, _ = divmod(remainder, 60)
-        uptime_string = f"{hours} hours, {minutes} minutes"
-        await interaction.response.send_message(f"Bot uptime: {uptime_string}")
-    else:
-        await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
+    import psutil
+    uptime_seconds = int(time.time() - psutil.boot_time())
+    hours, remainder = divmod(uptime_seconds, 3600)
+    minutes, _ = divmod(remainder, 60)
+    uptime_string = f"{hours} hours, {minutes} minutes"
+    await interaction.response.send_message(f"Bot uptime: {uptime_string}")
+
+def format_seconds(value):
+    if value is None:
+        return "n/a"
+    return f"{value * 1000:.0f} ms" if value < 1 else f"{value:.1f} s"
+
+@bot.tree.command(name='stats', description="Show event-loop, command, API and cache statistics.")
+async def stats(interaction: discord.Interaction):
+    """Summarises the telemetry also served on /metrics."""
+    embed = discord.Embed(title="📊 Bot Stats", color=discord.Color.blue())
+    lag = telemetry.series('fxbot_event_loop_lag_seconds').get(())
+    if lag is not None:
+        embed.add_field(name="⏱️ Event Loop Lag", value=f"p99 {format_seconds(lag.quantile(0.99))} • max {format_seconds(lag.max)}", inline=False)
+
+    interactions = sorted(telemetry.series('fxbot_interaction_seconds').items(), key=lambda item: -(item[1].quantile(0.95) or 0))
+    lines = []
+    for labels, histogram in interactions[:8]:
+        labels = dict(labels)
+        errors = f" • {labels['outcome']}" if labels['outcome'] != 'ok' else ""
+        lines.append(f"`{labels['name']}` p95 {format_seconds(histogram.quantile(0.95))} ({histogram.count}×{errors})")
+    embed.add_field(name="🐢 Slowest Interactions", value="\n".join(lines) or "None yet", inline=False)
+
+    hosts = {}
+    for labels, count in telemetry.series('fxbot_http_requests_total').items():
+        labels = dict(labels)
+        status = labels['status']
+        status_class = f"{status[0]}xx" if status.isdigit() else status
+        by_status = hosts.setdefault(labels['host'], {})
+        by_status[status_class] = by_status.get(status_class, 0) + count
+    lines = [
+        f"{host}: {sum(by_status.values())} ({', '.join(f'{status} {count}' for status, count in sorted(by_status.items()))})"
+        for host, by_status in sorted(hosts.items())
+    ]
+    embed.add_field(name="🌐 Outbound HTTP", value="\n".join(lines) or "None yet", inline=False)
+
+    tick = telemetry.series('fxbot_monitor_tick_seconds').get(())
+    if tick is not None:
+        embed.add_field(name="🔁 Monitor Tick", value=f"avg {format_seconds(tick.sum / tick.count)} • max {format_seconds(tick.max)} ({tick.count} ticks)", inline=False)
+
+    role = "leader" if leader_election.is_leader else "follower"
+    embed.add_field(name="🗳️ Replica", value=f"{leader_election.node_id} ({role})", inline=False)
+
+    caches = sorted({dict(labels)['cache'] for labels in telemetry.series('fxbot_cache_requests_total')})
+    lines = [f"{cache}: {telemetry.cache_ratio(cache):.0%}" for cache in caches]
+    embed.add_field(name="🗃️ Cache Hit Ratio", value="\n".join(lines) or "None yet", inline=False)
+    if TELEMETRY_PORT is not None:
+        embed.set_footer(text=f"Full metrics: http://{TELEMETRY_HOST}:{TELEMETRY_PORT}/metrics")
+    await interaction.response.send_message(embed=embed)
 
 @bot.command(name='add_user')
+@requires('manage', "ERROR ❌: You are not authorized to access this function!")
 async def authorized_user(ctx, *user_ids):
-    """Adds users to the authorized_users list."""
-    global authorized_users
-    if any(role.id in droplet_perms for role in ctx.author.roles) or ctx.author.id in authorized_users:
-        new_users = [int(user_id) for user_id in user_ids]
-        authorized_users.extend(user for user in new_users if user not in authorized_users)
-        save_permissions()
-        await ctx.send("Authorized users updated successfully ✅.")
-    else:
-        await ctx.send("ERROR ❌: You are not authorized to access this function!")
+    """Adds users to this server's authorized_users list."""
+    tenant = tenant_for(ctx)
+    authorized_users = tenant.settings.get('authorized_users', [])
+    new_users = [int(user_id) for user_id in user_ids]
+    tenant.update_settings(authorized_users=authorized_users + [user for user in dict.fromkeys(new_users) if user not in authorized_users])
+    await ctx.send("Authorized users updated successfully ✅.")
+
+@bot.tree.command(name="dashboard", description="Post the live droplet dashboard in this channel.")
+@requires('manage')
+async def post_dashboard(interaction: discord.Interaction):
+    """Posts the live dashboard here, replacing any previous one."""
+    await interaction.response.defer(ephemeral=True)
+    tenant = tenant_for(interaction)
+    await asyncio.gather(*(droplet.state.get() for droplet in tenant.fleet.values()))
+    await tenant.dashboard.post(interaction.channel)
+    await interaction.followup.send(f"Live dashboard posted; it updates every {DASHBOARD_INTERVAL} seconds. ✅", ephemeral=True)
 
 @bot.tree.command(name="embed", description="Display the droplet management embed.")
 async def slash_create_embed(interaction: discord.Interaction):
@@ -515,22 +3393,38 @@ async def slash_create_embed(interaction: discord.Interaction):
 @bot.tree.command(name="panel", description="Get a link to the FX Systems Pterodactyl Panel.")
 async def slash_panel_link(interaction: discord.Interaction):
     """Provides a link to the Pterodactyl panel."""
-    await interaction.response.send_message(f"Pterodactyl Panel: {FX_PANEL_LINK}")
+    tenant = tenant_for(interaction)
+    await interaction.response.send_message(f"Pterodactyl Panel: {tenant.settings.get('fx_panel_link', FX_PANEL_LINK)}")
     
-    if (interaction.user.id not in authorized_users or not any(role.id in droplet_perms for role in interaction.user.roles)):
+    if not tenant.permissions.allowed(interaction.user, 'manage'):
         await interaction.followup.send("Need help? Contact a Manager or Developer for more info.", ephemeral=True)
 
 @bot.tree.command(name="ping", description="Ping the server.")
 async def ping_server(interaction: discord.Interaction):
-    """Pings the server and reports the latency."""
+    """Probes the server and reports the latency along with rolling percentiles."""
+    await interaction.response.defer()
     try:
-        delay = ping3.ping(SERVER_IP)
+        droplet = tenant_for(interaction).primary
+        await health_prober.probe_droplet(droplet, jitter=False)
+        delay = health_prober.stats_for(droplet, 'ping').last
         if delay is not None:
-            await interaction.response.send_message(f"✅ Ping successful, Time: {delay * 1000:.2f} ms")
+            message = f"✅ Ping successful, Time: {delay:.2f} ms"
         else:
-            await interaction.response.send_message("❌ Ping failed: No response from the server!")
+            message = "❌ Ping failed: No response from the server!"
+        details = "\n".join(f"• {kind.upper()}: {health_prober.stats_for(droplet, kind).summary()}" for kind in health_prober.kinds(droplet))
+        await interaction.followup.send(f"{message}\n{details}")
     except Exception as e:
-        await interaction.response.send_message(f"⚠️ An unexpected error occurred while pinging: {str(e)}")
+        await interaction.followup.send(f"⚠️ An unexpected error occurred while pinging: {str(e)}")
 
 # --- Run the Bot ---
-bot.run(DISCORD_BOT_TOKEN)
\ No newline at end of file
+async def main():
+    """Starts the bot, timing the import phase for the startup report."""
+    startup_timings.append(("imports and config", time.perf_counter() - PROCESS_STARTED))
+    async with bot:
+        await bot.start(DISCORD_BOT_TOKEN)
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
\ No newline at end of file
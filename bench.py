@@ -0,0 +1,260 @@
+"""End-to-end benchmarks for the bot against the local simulator; no DigitalOcean, FX or Discord access needed.
+
+    python bench.py --duration 60 --rounds 20
+    python bench.py --json before.json   # then compare with a run after your change
+
+Reports interaction-ack latency, event-loop blocking, API calls per hour and resize-to-ready time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import discord
+
+from simulator import Simulator
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_USER = 4242  # Authorised user the fake interactions come from
+SIZE_LOW = 's-2vcpu-4gb-amd'  # Size every simulated droplet starts on
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list, or None if it is empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+def summarise(values):
+    return {'count': len(values), 'p50': percentile(values, 50), 'p99': percentile(values, 99), 'max': max(values, default=None)}
+
+class LoopLagMonitor:
+    """Measures how late a short sleep wakes up, i.e. how long something else held the event loop."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self.task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    def take(self):
+        """Returns and clears the samples gathered so far."""
+        samples, self.samples = self.samples, []
+        return samples
+
+    def stop(self):
+        self.task.cancel()
+
+# --- Fake Discord interactions ---
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    def _ack(self, kind, content=None):
+        if self.interaction.acked_at is None:
+            self.interaction.acked_at = time.perf_counter()
+        self._done = True
+        self.interaction.replies.append((kind, content))
+
+    async def send_message(self, content=None, **kwargs):
+        self._ack('message', content)
+
+    async def defer(self, **kwargs):
+        self._ack('defer')
+
+    async def edit_message(self, content=None, **kwargs):
+        self._ack('edit', content)
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        self.interaction.replies.append(('followup', content))
+
+class FakeInteraction(discord.Interaction):
+    """Just enough of an Interaction for command and component callbacks; records when it was acknowledged."""
+
+    def __init__(self, user_id=BENCH_USER, role_ids=()):
+        self.id = discord.utils.time_snowflake(discord.utils.utcnow())  # Backs Interaction.created_at
+        self.guild_id = None  # Served by the default tenant
+        self.user = SimpleNamespace(id=user_id, name=f'user-{user_id}', roles=[SimpleNamespace(id=role_id) for role_id in role_ids])
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.replies = []
+        self.started_at = time.perf_counter()
+        self.acked_at = None
+
+    @property
+    def ack_latency(self):
+        return None if self.acked_at is None else self.acked_at - self.started_at
+
+# --- Setup ---
+def load_app(workdir, simulator, args):
+    """Writes config and keys pointing at the simulator into a scratch directory and imports the bot there."""
+    droplets = [{'id': f'sim-{index}', 'name': f'sim-{index}'} for index in range(args.droplets)]
+    for droplet in droplets:
+        simulator.add_droplet(droplet['id'], size=SIZE_LOW)
+    config = {
+        **simulator.config(),
+        'droplet_id': droplets[0]['id'],
+        'droplets': droplets if args.droplets > 1 else [],
+        'server_ip': '127.0.0.1',
+        'log_channel_id': 0,
+        'check_interval': args.check_interval,
+        'player_poll_interval': args.poll_interval,
+        'droplet_perms': [],
+        'authorized_users': [BENCH_USER],
+        'restart_perms': [],
+    }
+    with open(os.path.join(workdir, 'config.json'), 'w') as f:
+        json.dump(config, f, indent=4)
+    with open(os.path.join(workdir, 'keys.json'), 'w') as f:
+        json.dump({'discord_bot_token': '', 'confirm_command': '', 'digital_ocean_key': 'simulated'}, f)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    import app
+    return app
+
+async def settle_actions(app):
+    """Waits for every action the bot is still tracking."""
+    await asyncio.gather(*(entry['future'] for entry in app.action_tracker.actions.values()))
+
+def api_calls_since(simulator, before):
+    return {route: count - before.get(route, 0) for route, count in simulator.calls.items() if count - before.get(route, 0)}
+
+# --- Benchmarks ---
+async def bench_interactions(app, rounds):
+    """Ack latency of panel buttons, the confirmation dialog and a few slash commands."""
+    latencies = {}
+
+    async def measure(name, callback, *extra):
+        interaction = FakeInteraction()
+        await callback(interaction, *extra)
+        latencies.setdefault(name, []).append(interaction.ack_latency)
+
+    players = app.bot.tree.get_command('players').callback
+    jobs = app.bot.tree.get_command('jobs').callback
+    for _ in range(rounds):
+        panel = app.DropletManagementView()
+        await measure('panel: resize button', panel.resize_high.callback)
+        await measure('panel: reboot button', panel.reboot.callback)
+        await measure('confirm: reboot', app.ConfirmationView('reboot').confirm.callback)
+        await measure('/players', players)
+        await measure('/jobs', jobs)
+    await settle_actions(app)
+    return {name: summarise([value for value in values if value is not None]) for name, values in latencies.items()}
+
+async def bench_steady_state(app, simulator, duration):
+    """API calls per hour while the polling and monitoring loops run with nothing to resize."""
+    simulator.set_players(5)  # Fits the low plan the droplets start on
+    before = dict(simulator.calls)
+    app.poll_players.start()
+    app.monitor_server.start()
+    await asyncio.sleep(duration)
+    app.poll_players.cancel()
+    app.monitor_server.cancel()
+    calls = api_calls_since(simulator, before)
+    per_hour = {route: count * 3600 / duration for route, count in sorted(calls.items())}
+    return {'per_hour': per_hour, 'total_per_hour': sum(per_hour.values())}
+
+async def bench_resize(app, simulator):
+    """Time from the monitor deciding to scale up until the droplet is resized and rebooted."""
+    simulator.set_players(40)  # Over the low plan's capacity, so the monitor resizes straight away
+    await app.poll_players()
+    for droplet in app.fleet.values():
+        droplet.last_resize_time = 0  # Skip the cooldown left by anything earlier in the run
+
+    async def timed(droplet):
+        started = time.perf_counter()
+        await app.monitor_droplet(droplet)
+        return droplet.id, time.perf_counter() - started
+
+    results = dict(await asyncio.gather(*(timed(droplet) for droplet in app.fleet.values())))
+    floor = simulator.durations['resize'] + simulator.durations['reboot']
+    ready = [simulator.droplets[droplet_id]['status'] == 'active' and simulator.droplets[droplet_id]['size']['slug'] != SIZE_LOW for droplet_id in results]
+    return {
+        'seconds': summarise(list(results.values())),
+        'simulated_floor': floor,
+        'overhead_p50': percentile(list(results.values()), 50) - floor,
+        'all_ready': all(ready),
+    }
+
+def print_report(results):
+    print("\n== Interaction ack latency (ms) ==")
+    for name, stats in results['interactions'].items():
+        print(f"  {name:<24} p50 {stats['p50'] * 1000:7.1f}  p99 {stats['p99'] * 1000:7.1f}  max {stats['max'] * 1000:7.1f}  (n={stats['count']})")
+    print("\n== Event-loop blocking (ms) ==")
+    for phase, stats in results['loop_lag'].items():
+        if stats['count']:
+            print(f"  {phase:<24} p50 {stats['p50'] * 1000:7.1f}  p99 {stats['p99'] * 1000:7.1f}  max {stats['max'] * 1000:7.1f}")
+    print("\n== API calls per hour (steady state) ==")
+    for route, rate in results['steady_state']['per_hour'].items():
+        print(f"  {route:<40} {rate:9.0f}")
+    print(f"  {'total':<40} {results['steady_state']['total_per_hour']:9.0f}")
+    resize = results['resize']
+    print("\n== Resize to ready ==")
+    print(f"  p50 {resize['seconds']['p50']:.1f}s  max {resize['seconds']['max']:.1f}s  "
+          f"(simulated resize + reboot {resize['simulated_floor']:.1f}s, overhead {resize['overhead_p50']:.1f}s, all ready: {resize['all_ready']})")
+
+async def run(args):
+    simulator = Simulator(
+        latency=args.latency, jitter=args.latency / 2, error_rate=args.error_rate,
+        resize_seconds=args.resize_seconds, reboot_seconds=args.reboot_seconds, power_seconds=args.reboot_seconds,
+    )
+    await simulator.start()
+    workdir = tempfile.mkdtemp(prefix='fx-bench-')
+    app = load_app(workdir, simulator, args)
+    lag = LoopLagMonitor()
+    lag.start()
+    results = {'loop_lag': {}}
+    try:
+        results['interactions'] = await bench_interactions(app, args.rounds)
+        results['loop_lag']['interactions'] = summarise(lag.take())
+        results['steady_state'] = await bench_steady_state(app, simulator, args.duration)
+        results['loop_lag']['steady state'] = summarise(lag.take())
+        results['resize'] = await bench_resize(app, simulator)
+        results['loop_lag']['resize'] = summarise(lag.take())
+    finally:
+        lag.stop()
+        await app.close_http_session()
+        await app.metrics_store.close()
+        await simulator.stop()
+    print_report(results)
+    if args.json:
+        with open(os.path.join(REPO_DIR, args.json) if not os.path.isabs(args.json) else args.json, 'w') as f:
+            json.dump(results, f, indent=4)
+    return results
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the bot against the local simulator.")
+    parser.add_argument('--droplets', type=int, default=1, help="Droplets in the simulated fleet")
+    parser.add_argument('--rounds', type=int, default=20, help="Rounds of fake interactions")
+    parser.add_argument('--duration', type=float, default=60, help="Seconds of steady-state polling to measure")
+    parser.add_argument('--check-interval', type=int, default=30, help="Monitor loop interval during the run")
+    parser.add_argument('--poll-interval', type=int, default=30, help="Player poll interval during the run")
+    parser.add_argument('--latency', type=float, default=0.05, help="Mean simulated API latency in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of API requests that fail with a 500")
+    parser.add_argument('--resize-seconds', type=float, default=5)
+    parser.add_argument('--reboot-seconds', type=float, default=2)
+    parser.add_argument('--json', help="Also write the results to this file")
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    asyncio.run(run(parse_args()))
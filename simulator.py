@@ -0,0 +1,211 @@
+"""Local stand-in for the DigitalOcean droplet/action endpoints and the FX server-stats endpoint.
+
+Run it on its own and point `do_api_url` and `fx_api_url` in config.json at it:
+
+    python simulator.py --port 8800 --resize-seconds 60 --error-rate 0.02
+
+or start it from Python (see bench.py) to drive the bot end to end without real credentials.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+# vCPUs, memory (MB) and disk (GB) of the sizes the bot uses
+SIZES = {
+    's-1vcpu-2gb-intel': (1, 2048, 70),
+    's-2vcpu-4gb-amd': (2, 4096, 80),
+    's-4vcpu-8gb-amd': (4, 8192, 160),
+    's-4vcpu-16gb-amd': (4, 16384, 200),
+    's-v8cpu-16gb-amd': (8, 16384, 320),
+}
+
+class Simulator:
+    """In-memory droplets, actions and game servers served over HTTP with injected latency and failures."""
+
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, rate_limit_rate=0.0, action_error_rate=0.0,
+                 resize_seconds=60, reboot_seconds=20, power_seconds=10):
+        self.latency = latency  # Mean seconds added to every response
+        self.jitter = jitter  # Max seconds of random variation around the mean
+        self.error_rate = error_rate  # Fraction of requests answered with a 500
+        self.rate_limit_rate = rate_limit_rate  # Fraction of requests answered with a 429
+        self.action_error_rate = action_error_rate  # Fraction of actions that finish as 'errored'
+        self.durations = {'resize': resize_seconds, 'reboot': reboot_seconds, 'power_on': power_seconds, 'power_off': power_seconds}
+        self.droplets = {}  # Droplet ID -> droplet JSON as the API returns it
+        self.actions = {}  # Action ID -> action JSON plus the simulator's private fields
+        self.next_action_id = 1
+        self.servers = {}  # Game server name -> player count
+        self.calls = Counter()  # "METHOD /route" -> requests received
+        self.runner = None
+        self.base_url = None
+
+    # --- State ---
+    def add_droplet(self, droplet_id, size='s-2vcpu-4gb-amd', status='active'):
+        vcpus, memory, disk = SIZES.get(size, (1, 1024, 25))
+        self.droplets[str(droplet_id)] = {
+            'id': str(droplet_id), 'name': f'sim-{droplet_id}', 'status': status, 'locked': False,
+            'size': {'slug': size}, 'vcpus': vcpus, 'memory': memory, 'disk': disk,
+        }
+
+    def set_players(self, total, servers=3):
+        """Spreads a total player count across a number of game servers."""
+        self.servers = {f'server-{index}': total // servers + (index < total % servers) for index in range(servers)}
+
+    def _settle(self):
+        """Finishes actions whose simulated duration has passed."""
+        now = time.monotonic()
+        for action in self.actions.values():
+            if action['status'] != 'in-progress' or now < action['_completes_at']:
+                continue
+            action['status'] = action['_outcome']
+            action['completed_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            droplet = self.droplets[action['resource_id']]
+            droplet['locked'] = False
+            if action['_outcome'] != 'completed':
+                droplet['status'] = 'off' if action['type'] == 'resize' else droplet['status']
+                continue
+            if action['type'] == 'resize':
+                droplet['size'] = {'slug': action['_size']}
+                droplet['vcpus'], droplet['memory'], droplet['disk'] = SIZES.get(action['_size'], (1, 1024, 25))
+                droplet['status'] = 'off'  # Resized droplets come back powered off until rebooted
+            else:
+                droplet['status'] = 'off' if action['type'] == 'power_off' else 'active'
+
+    # --- HTTP ---
+    @web.middleware
+    async def _faults(self, request, handler):
+        route = request.match_info.route.resource
+        self.calls[f"{request.method} {route.canonical if route else request.path}"] += 1
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            return web.json_response({'id': 'too_many_requests', 'message': 'API rate limit exceeded.'}, status=429, headers={'Retry-After': '1'})
+        if roll < self.rate_limit_rate + self.error_rate:
+            return web.json_response({'id': 'server_error', 'message': 'Simulated failure.'}, status=500)
+        self._settle()
+        return await handler(request)
+
+    async def get_droplet(self, request):
+        droplet = self.droplets.get(request.match_info['droplet_id'])
+        if droplet is None:
+            return web.json_response({'id': 'not_found', 'message': 'The resource you were accessing could not be found.'}, status=404)
+        body = json.dumps({'droplet': droplet}, sort_keys=True)
+        etag = '"' + hashlib.md5(body.encode()).hexdigest() + '"'
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(text=body, content_type='application/json', headers={'ETag': etag})
+
+    async def post_action(self, request):
+        droplet = self.droplets.get(request.match_info['droplet_id'])
+        if droplet is None:
+            return web.json_response({'id': 'not_found', 'message': 'The resource you were accessing could not be found.'}, status=404)
+        payload = await request.json()
+        action_type = payload.get('type')
+        if action_type not in self.durations:
+            return web.json_response({'id': 'unprocessable_entity', 'message': f'Unknown action type {action_type}.'}, status=422)
+        if action_type == 'resize' and payload.get('size') not in SIZES:
+            return web.json_response({'id': 'unprocessable_entity', 'message': 'You specified an invalid size for Droplet creation.'}, status=422)
+        if droplet['locked']:
+            return web.json_response({'id': 'unprocessable_entity', 'message': 'Droplet already has a pending event.'}, status=422)
+        action_id = self.next_action_id
+        self.next_action_id += 1
+        droplet['locked'] = True
+        if action_type == 'resize':
+            droplet['status'] = 'off'
+        self.actions[action_id] = {
+            'id': action_id, 'status': 'in-progress', 'type': action_type, 'resource_id': droplet['id'], 'resource_type': 'droplet',
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'completed_at': None,
+            '_completes_at': time.monotonic() + self.durations[action_type],
+            '_outcome': 'errored' if random.random() < self.action_error_rate else 'completed',
+            '_size': payload.get('size'),
+        }
+        return web.json_response({'action': self._public(self.actions[action_id])}, status=201)
+
+    async def get_action(self, request):
+        action = self.actions.get(int(request.match_info['action_id']))
+        if action is None:
+            return web.json_response({'id': 'not_found', 'message': 'The resource you were accessing could not be found.'}, status=404)
+        return web.json_response({'action': self._public(action)})
+
+    async def server_stats(self, request):
+        page, per_page = int(request.query.get('page', 0)), int(request.query.get('perPage', 20))
+        servers = sorted(self.servers.items())
+        items = [{'id': name, 'name': name, 'playerCount': count} for name, count in servers[page * per_page:(page + 1) * per_page]]
+        return web.json_response({'items': items, 'total': len(servers), 'totalPages': max(1, -(-len(servers) // per_page))})
+
+    @staticmethod
+    def _public(action):
+        return {key: value for key, value in action.items() if not key.startswith('_')}
+
+    def app(self):
+        app = web.Application(middlewares=[self._faults])
+        app.router.add_get('/v2/droplets/{droplet_id}', self.get_droplet)
+        app.router.add_post('/v2/droplets/{droplet_id}/actions', self.post_action)
+        app.router.add_get('/v2/actions/{action_id}', self.get_action)
+        app.router.add_get('/fx/server-stats', self.server_stats)
+        return app
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Starts serving; returns the base URL. Port 0 picks a free port."""
+        self.runner = web.AppRunner(self.app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f'http://{host}:{port}'
+        return self.base_url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def config(self):
+        """config.json entries that point the bot at this simulator."""
+        return {'do_api_url': f'{self.base_url}/v2', 'fx_api_url': f'{self.base_url}/fx/'}
+
+async def serve(args):
+    simulator = Simulator(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+        action_error_rate=args.action_error_rate, resize_seconds=args.resize_seconds, reboot_seconds=args.reboot_seconds,
+    )
+    for droplet_id in args.droplet:
+        simulator.add_droplet(droplet_id, size=args.size)
+    simulator.set_players(args.players, args.servers)
+    await simulator.start(args.host, args.port)
+    print(f"Simulator listening on {simulator.base_url}; add to config.json:")
+    print(json.dumps({**simulator.config(), 'droplet_id': args.droplet[0]}, indent=4))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await simulator.stop()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a simulated DigitalOcean and FX API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--droplet', action='append', help="Droplet ID to simulate (repeatable)")
+    parser.add_argument('--size', default='s-2vcpu-4gb-amd', help="Starting size slug")
+    parser.add_argument('--players', type=int, default=5)
+    parser.add_argument('--servers', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--action-error-rate', type=float, default=0.0)
+    parser.add_argument('--resize-seconds', type=float, default=60)
+    parser.add_argument('--reboot-seconds', type=float, default=20)
+    args = parser.parse_args(argv)
+    args.droplet = args.droplet or ['448886902']
+    return args
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        pass